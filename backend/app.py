@@ -1,31 +1,144 @@
-from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for, flash
+from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for, flash, g, Response, \
+    stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
 import os
+import io
+import re
+import contextvars
+import math
 import uuid
 import json
+import hashlib
+import base64
+import time
 from datetime import datetime
-from PIL import Image, ImageDraw, ImageFont
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from functools import lru_cache
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageDraw
 import numpy as np
-from utils.dmc_colors import find_closest_dmc_color, get_all_dmc_colors
+from utils.dmc_colors import find_closest_dmc_color, get_all_dmc_colors, palette_version
+from utils.color_lut import lookup_nearest
+from utils.color_metrics import DEFAULT_METRIC, METRICS, metric_distance, to_metric_space
+from utils.chart_raster import palette_colors, rasterize_colors, rasterize_symbols
+from utils.glyph_atlas import FONT_NAME, chart_font, get_font, glyph_atlas
+from utils.pattern_format import decode_grid, encode_grid, encode_pattern, load_pattern_data, local_symbol_map, palette_lookup
+from utils.tile_cache import TileCache
+from utils.blob_store import BlobStore
+from utils.upload_store import UploadStore
+from utils.pattern_edit import EditError, PatternEdit, colors_in_order
+from utils.pdf_writer import PAGE_A4, PageContent, PdfWriter
+from utils.jobs import JobManager, JobRejected
+from utils.result_cache import ResultCache, cache_key, file_sha256
+from utils.ingest import (ImageRejected, open_decoded, probe_image, resize_decoded, working_copy,
+                          working_copy_extension)
+from utils.metrics import metrics, server_timing
+from utils.palette import get_palette
+from utils.progress import ProgressConflict, apply_ops, color_counts, decode_progress, encode_progress
+from utils.dither import DITHER_MODES, dither_indices
+from utils.parallel import BandPool
+from utils.sqlite_config import DEFAULT_PRAGMAS, engine_options, install_pragmas, is_file_database
+from utils.write_behind import WriteBehind
+from utils.usage import DEFAULT_STITCH, STITCH_TYPES, strands_for_mesh, thread_estimate, usage_index, valid_usage
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///needlepoint.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PRAGMAS'] = DEFAULT_PRAGMAS  # WAL journaling, busy timeout and synchronous level per connection
+app.config['DB_POOL_SIZE'] = 8  # connections per worker process
+app.config['DB_MAX_OVERFLOW'] = 8
+app.config['PROGRESS_FLUSH_DELAY'] = 0.5  # seconds progress writes are coalesced; 0 writes on every request
+app.config['PROGRESS_MAX_PENDING'] = 64  # patterns with unwritten progress before a flush is forced
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32MB max file size
+app.config['MAX_IMAGE_PIXELS'] = 64 * 1024 * 1024  # larger images are rejected before decoding
+app.config['UPLOAD_MAX_BYTES'] = 2 * 1024 * 1024 * 1024  # unreferenced uploads are evicted beyond this
+app.config['UPLOAD_TTL'] = 24 * 3600  # seconds an upload no saved pattern uses is kept
+app.config['UPLOAD_MIN_AGE'] = 15 * 60  # uploads used more recently are never evicted
+app.config['UPLOAD_SWEEP_INTERVAL'] = 600
+app.config['UPLOAD_WORKING_MAX_SIDE'] = 3000  # larger originals are stored downscaled
+app.config['COLOR_LUT_FOLDER'] = os.path.join('cache', 'color_lut')  # None keeps LUTs in memory only
+app.config['TILE_CACHE_FOLDER'] = os.path.join('cache', 'tiles')  # None keeps tiles in memory only
+app.config['TILE_CACHE_MEMORY_BYTES'] = 64 * 1024 * 1024
+app.config['TILE_CACHE_DISK_BYTES'] = 512 * 1024 * 1024
+app.config['RESULT_CACHE_FOLDER'] = os.path.join('cache', 'results')  # None disables the result cache
+app.config['RESULT_CACHE_BYTES'] = 256 * 1024 * 1024
+app.config['METRICS_ENABLED'] = True  # stage histograms at /metrics; False removes all timing work
+app.config['JOB_WORKERS'] = None  # None uses one worker process per CPU
+app.config['JOB_MAX_PENDING'] = 32
+app.config['JOB_MAX_PER_USER'] = 2
+app.config['JOB_RESULT_TTL'] = 600  # seconds finished jobs stay pollable
+app.config['PATTERN_BLOB_FOLDER'] = 'pattern_blobs'  # stitch grids of saved patterns
+app.config['PATTERN_BLOB_MIN_AGE'] = 15 * 60  # unreferenced blobs younger than this are kept
+app.config['PATTERN_BLOB_SWEEP_INTERVAL'] = 3600
+app.config['PIPELINE_WORKERS'] = None  # threads per large conversion; None uses one per CPU, 1 runs serially
+app.config['PIPELINE_MIN_CELLS'] = 250_000  # smaller grids are converted on the request thread
+app.config.from_prefixed_env()  # FLASK_<KEY> environment variables override the settings above
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+install_pragmas(app.config['SQLITE_PRAGMAS'])
+if is_file_database(app.config['SQLALCHEMY_DATABASE_URI']):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLITE_PRAGMAS']['busy_timeout'] / 1000,
+                                                             app.config['DB_POOL_SIZE'],
+                                                             app.config['DB_MAX_OVERFLOW'])
 db = SQLAlchemy(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+tile_cache = TileCache(app.config['TILE_CACHE_FOLDER'],
+                       app.config['TILE_CACHE_MEMORY_BYTES'],
+                       app.config['TILE_CACHE_DISK_BYTES'])
+metrics.enabled = app.config['METRICS_ENABLED']
+result_cache = ResultCache(app.config['RESULT_CACHE_FOLDER'], app.config['RESULT_CACHE_BYTES'])
+jobs = JobManager(app.config['JOB_WORKERS'],
+                  app.config['JOB_MAX_PENDING'],
+                  app.config['JOB_MAX_PER_USER'],
+                  app.config['JOB_RESULT_TTL'])
+pipeline = BandPool(app.config['PIPELINE_WORKERS'], app.config['PIPELINE_MIN_CELLS'])
+working_copies = ThreadPoolExecutor(max_workers=1, thread_name_prefix='working-copy')
+
+def referenced_uploads(names):
+    """Upload file names used by saved patterns"""
+    with app.app_context():
+        rows = db.session.query(Pattern.original_image).filter(Pattern.original_image.in_(names)).distinct()
+        return {row[0] for row in rows}
+
+GRID_REF_PATTERN = re.compile(r'"grid_ref":\s*"([0-9a-f]{64})"')
+
+def referenced_blobs(batch_size=500):
+    """Blob keys used by saved patterns and their revisions"""
+    keys = set()
+    with app.app_context():
+        for model in (Pattern, PatternRevision):
+            last_id = 0
+            while True:
+                rows = (db.session.query(model.id, model.pattern_data)
+                        .filter(model.id > last_id).order_by(model.id).limit(batch_size).all())
+                if not rows:
+                    break
+                for _, pattern_data in rows:
+                    keys.update(GRID_REF_PATTERN.findall(pattern_data))
+                last_id = rows[-1][0]
+    return keys
+
+blob_store = BlobStore(app.config['PATTERN_BLOB_FOLDER'],
+                       min_age=app.config['PATTERN_BLOB_MIN_AGE'],
+                       referenced=referenced_blobs)
+
+upload_store = UploadStore(app.config['UPLOAD_FOLDER'],
+                           app.config['UPLOAD_MAX_BYTES'],
+                           app.config['UPLOAD_TTL'],
+                           app.config['UPLOAD_MIN_AGE'],
+                           referenced_uploads)
+
 # Supported image formats
 ALLOWED_EXTENSIONS = {
     'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'tif', 
@@ -37,6 +150,27 @@ DEFAULT_CELL_PX = 28
 HEAVY_GRID_EVERY = 10
 MEDIUM_GRID_EVERY = 5
 LEGEND_WIDTH_PX = 520
+RENDER_BAND_ROWS = 64
+TILE_SIZE = 256
+THUMBNAIL_PX = 160
+GALLERY_PAGE_SIZE = 24
+TILE_CELL_PX = (1, 2, 4, 7, 14, DEFAULT_CELL_PX)  # stitch size per zoom level, z=0 most zoomed out
+TILE_MIN_GRID_CELL_PX = 4
+TILE_MIN_SYMBOL_CELL_PX = 14
+REDUCE_MODES = ('frequency', 'kmeans')
+BATCH_MAX_IMAGES = 4
+BATCH_MAX_VARIANTS = 12
+PREVIEW_MAX_STITCHES = 64  # longest side of the coarse streamed preview
+STREAM_BAND_ROWS = 32
+PDF_CELL_PT = 9.0  # printed stitch size, about 3.2 mm
+PDF_CELL_PX = 18  # rasterized stitch size on PDF pages (144 dpi)
+PDF_PAGE_OVERLAP = 2  # stitches repeated at the edges of neighbouring pages
+PDF_MARGIN_PT = 36
+PDF_LABEL_PT = 16
+PDF_HEADER_PT = 24
+PDF_LEGEND_ROW_PT = 16
+PATTERN_MAX_REVISIONS = 50  # undo steps kept per pattern
+PATTERN_ALGORITHM_VERSION = 5  # bump whenever conversion output changes, to retire cached results
 SYMBOLS = list("1234567890ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz!@#$%^&*()[]{}<>?/+=~:;,.")
 
 # Database Models
@@ -61,6 +195,33 @@ class Pattern(db.Model):
     colors_used = db.Column(db.Text, nullable=False)  # JSON string
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     progress_data = db.Column(db.Text, nullable=True)  # JSON string for progress tracking
+    
+    __table_args__ = (db.Index('ix_pattern_user_folder_created', 'user_id', 'folder_id', 'created_at'),)
+
+class PatternSummary(db.Model):
+    pattern_id = db.Column(db.Integer, db.ForeignKey('pattern.id'), primary_key=True)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    color_count = db.Column(db.Integer, nullable=False)
+    stitches_done = db.Column(db.Integer, nullable=False, default=0)
+    thumbnail = db.deferred(db.Column(db.LargeBinary, nullable=False))  # PNG bytes
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_dict(self):
+        total = self.width * self.height
+        return {
+            'width': self.width,
+            'height': self.height,
+            'color_count': self.color_count,
+            'percent_complete': round(100.0 * self.stitches_done / total, 1) if total else 0.0
+        }
+
+class PatternRevision(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    pattern_id = db.Column(db.Integer, db.ForeignKey('pattern.id'), nullable=False, index=True)
+    pattern_data = db.Column(db.Text, nullable=False)  # JSON string before the edit; grids stay in the blob store
+    colors_used = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Folder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -93,58 +254,157 @@ def load_user(user_id):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def resize_to_stitches(img, stitches_w, stitches_h):
-    """Resize image to stitch grid using LANCZOS"""
-    rgb = img.convert("RGB")
-    return rgb.resize((stitches_w, stitches_h), Image.Resampling.LANCZOS)
+@contextmanager
+def conversion_source(image_path, image_hash):
+    """Open an upload for conversion; yields (file, content key for cache entries)
+
+    A large or rotated upload is replaced by its downscaled working copy in
+    the background, and the two decode to different grids, so the original
+    gets a key of its own. Decoding from the yielded file keeps reading the
+    version that was keyed even if the working copy lands meanwhile.
+    """
+    with open(image_path, 'rb') as source:
+        pending = working_copy_extension(source, app.config['UPLOAD_WORKING_MAX_SIDE']) is not None
+        source.seek(0)
+        yield source, f"{image_hash}:original" if pending else image_hash
 
-def nearest_color_indices(image_rgb, palette_rgb):
+def stitch_grids(image_path, image_hash, sizes):
+    """Decoded and resized uint8 RGB stitch grids per (w, h), cached by image content
+
+    Sizes missing from the cache share a single decode of the image.
+    """
+    return dict(iter_stitch_grids(image_path, image_hash, sizes))
+
+def iter_stitch_grids(image_path, image_hash, sizes):
+    """Yield ((w, h), grid) in the order of sizes, cached by image content
+
+    The image is decoded once, when the first uncached size is reached, and
+    each grid is only resized when it is yielded.
+    """
+    keys = {size: cache_key('grid', image_hash, *size, PATTERN_ALGORITHM_VERSION) for size in sizes}
+    cached = {size: result_cache.get(key) for size, key in keys.items()}
+    missing = [size for size in keys if cached[size] is None]
+    decoded = None
+    grids = {}
+    for size in sizes:
+        if size in grids:
+            yield size, grids[size]
+            continue
+        if cached[size] is not None:
+            grids[size] = np.load(io.BytesIO(cached[size]))
+            yield size, grids[size]
+            continue
+        if decoded is None:
+            with metrics.stage('decode') as stage:
+                decoded = open_decoded(image_path, missing, app.config['MAX_IMAGE_PIXELS'])
+                stage.nbytes = decoded[2]['decoded_bytes']
+            stats = decoded[2]
+            app.logger.info("Decoded %s %dx%d at %dx%d in %.1f ms (%d decoded bytes, peak RSS +%d bytes)",
+                            stats['format'], *stats['source_size'], *stats['decoded_size'],
+                            stats['decode_ms'], stats['decoded_bytes'], stats['peak_rss_growth'])
+        with metrics.stage('resize') as stage:
+            grid = np.array(resize_decoded(decoded[0], decoded[1], *size), dtype=np.uint8)
+            stage.nbytes = grid.nbytes
+        buf = io.BytesIO()
+        np.save(buf, grid)
+        result_cache.put(keys[size], buf.getvalue())
+        grids[size] = grid
+        yield size, grid
+
+def stitch_grid(image_path, image_hash, stitches_w, stitches_h):
+    """Decoded and resized uint8 RGB stitch grid, cached by image content"""
+    return stitch_grids(image_path, image_hash, [(stitches_w, stitches_h)])[(stitches_w, stitches_h)]
+
+def dmc_palette():
+    """DMC palette as a read-only RGB array and a {index: (dmc, name, rgb)} lookup, shared by all requests"""
+    palette = get_palette('dmc')
+    return palette.rgb, palette.lookup
+
+def parse_canvas_size(canvas_size):
+    """(width, height) in stitches from a 'WxH' string"""
+    try:
+        width, height = (int(side) for side in canvas_size.split('x'))
+    except ValueError:
+        raise ValueError(f"Invalid canvas size '{canvas_size}'") from None
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Invalid canvas size '{canvas_size}'")
+    return width, height
+
+@metrics.timed('match')
+def nearest_color_indices(image_rgb, palette_rgb, metric=DEFAULT_METRIC):
     """Find nearest DMC color for each pixel"""
     H, W, _ = image_rgb.shape
-    img = image_rgb.reshape(-1, 3).astype(np.int16)
-    
-    N = palette_rgb.shape[0]
-    chunk = 50000
-    best_idx = np.zeros(img.shape[0], dtype=np.int32)
-    best_dist = np.full(img.shape[0], 1e12, dtype=np.int64)
-    
-    for start in range(0, img.shape[0], chunk):
-        end = min(start + chunk, img.shape[0])
-        block = img[start:end]
-        diff = block[:, None, :] - palette_rgb[None, :, :]
-        dist2 = (diff * diff).sum(axis=2)
-        idx = dist2.argmin(axis=1)
-        val = dist2.min(axis=1)
-        sel = val < best_dist[start:end]
-        best_idx[start:end][sel] = idx[sel]
-        best_dist[start:end][sel] = val[sel]
-    
-    return best_idx.reshape(H, W)
-
-def reduce_to_top_colors(idx_map, max_colors):
-    """Reduce to top N colors by frequency"""
-    if max_colors <= 0:
-        return idx_map
+    pixels = np.asarray(image_rgb, dtype=np.uint8)
+    out = np.empty((H, W), dtype=np.int32)
+    
+    def match(band):
+        y0, y1 = band
+        out[y0:y1] = lookup_nearest(pixels[y0:y1], palette_rgb, metric,
+                                    cache_dir=app.config['COLOR_LUT_FOLDER']).reshape(y1 - y0, W)
+    
+    pipeline.map(match, pipeline.split(H, W))
+    return out
+
+def top_frequency_colors(unique, counts, max_colors):
+    """Pick the N most frequently used palette indices"""
+    order = np.argsort(-counts, kind='stable')
+    return np.sort(unique[order[:max_colors]])
+
+def kmeans_colors(unique, counts, max_colors, palette_rgb, metric=DEFAULT_METRIC, iterations=20):
+    """Pick N palette indices by weighted k-means over the used colors"""
+    points = to_metric_space(palette_rgb[unique], metric)
+    weights = counts.astype(np.float64)
     
-    flat = idx_map.reshape(-1)
-    unique, counts = np.unique(flat, return_counts=True)
-    order = np.argsort(-counts)
-    keep = set(unique[order[:min(max_colors, len(unique))]])
+    # Seed with the most frequent colors so results are deterministic
+    seeds = np.argsort(-counts, kind='stable')[:max_colors]
+    centers = points[seeds].copy()
+    for _ in range(iterations):
+        labels = metric_distance(points[:, None, :], centers[None, :, :], metric).argmin(axis=1)
+        totals = np.bincount(labels, weights=weights, minlength=len(centers))
+        moved = np.stack([np.bincount(labels, weights=weights * points[:, c], minlength=len(centers))
+                          for c in range(3)], axis=1)
+        filled = totals > 0
+        updated = centers.copy()
+        updated[filled] = moved[filled] / totals[filled, None]
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    
+    # Snap each center to the closest thread actually used in the image
+    nearest = metric_distance(centers[:, None, :], points[None, :, :], metric).argmin(axis=1)
+    return np.unique(unique[nearest])
+
+def remap_to_kept_colors(idx_map, kept, palette_rgb, metric=DEFAULT_METRIC):
+    """Replace every palette index with the nearest kept color in color space"""
+    used = np.flatnonzero(pipeline.bincount(idx_map, len(palette_rgb)))
+    dist = metric_distance(to_metric_space(palette_rgb[used], metric)[:, None, :],
+                           to_metric_space(palette_rgb[kept], metric)[None, :, :], metric)
+    lut = np.arange(len(palette_rgb), dtype=np.int32)
+    lut[used] = kept[dist.argmin(axis=1)]
     
-    if len(keep) == len(unique):
+    out = np.empty(idx_map.shape, dtype=np.int32)
+    def remap(band):
+        out[band[0]:band[1]] = lut[idx_map[band[0]:band[1]]]
+    pipeline.map(remap, pipeline.split(*idx_map.shape))
+    return out
+
+@metrics.timed('reduce')
+def reduce_to_top_colors(idx_map, max_colors, palette_rgb, metric=DEFAULT_METRIC, mode='frequency'):
+    """Reduce to N colors, chosen by frequency or by k-means"""
+    if max_colors <= 0:
         return idx_map
     
-    kept_sorted = np.array(sorted(list(keep)))
-    map_lut = {}
-    for u in unique:
-        if u in keep:
-            map_lut[u] = u
-        else:
-            j = np.abs(kept_sorted - u).argmin()
-            map_lut[u] = int(kept_sorted[j])
+    counts = pipeline.bincount(idx_map, len(palette_rgb))
+    unique = np.flatnonzero(counts)
+    counts = counts[unique]
+    if len(unique) <= max_colors:
+        return idx_map
     
-    remapped = np.vectorize(lambda z: map_lut[z], otypes=[np.int32])(idx_map)
-    return remapped
+    if mode == 'kmeans':
+        kept = kmeans_colors(unique, counts, max_colors, palette_rgb, metric)
+    else:
+        kept = top_frequency_colors(unique, counts, max_colors)
+    return remap_to_kept_colors(idx_map, kept, palette_rgb, metric)
 
 def build_symbol_map(used_palette_indices):
     """Create symbol mapping for colors"""
@@ -155,26 +415,6 @@ def build_symbol_map(used_palette_indices):
         mapping[idx] = SYMBOLS[i]
     return mapping
 
-def draw_grid(draw, W, H, cell):
-    """Draw grid lines on the pattern"""
-    for x in range(W + 1):
-        xpx = x * cell
-        width = 1
-        if x % HEAVY_GRID_EVERY == 0:
-            width = 3
-        elif x % MEDIUM_GRID_EVERY == 0:
-            width = 2
-        draw.line([(xpx, 0), (xpx, H * cell)], fill=(0, 0, 0), width=width)
-    
-    for y in range(H + 1):
-        ypx = y * cell
-        width = 1
-        if y % HEAVY_GRID_EVERY == 0:
-            width = 3
-        elif y % MEDIUM_GRID_EVERY == 0:
-            width = 2
-        draw.line([(0, ypx), (W * cell, ypx)], fill=(0, 0, 0), width=width)
-
 def luminance(rgb):
     """Calculate luminance for text color choice"""
     r, g, b = rgb
@@ -184,57 +424,61 @@ def symbol_text_color(bg):
     """Choose text color based on background luminance"""
     return (0, 0, 0) if luminance(bg) > 140 else (255, 255, 255)
 
+def paste_chart_bands(out, mode, W, H, cell_px, rasterize):
+    """Fill the chart area of out in row bands produced by rasterize(y_px, h_px)"""
+    # Large charts rasterize a few bands ahead on the pipeline; bands are
+    # pasted in order and only those in flight are alive beside the image
+    band_img = None
+    bands = pipeline.imap(lambda y: rasterize(y*cell_px, min(RENDER_BAND_ROWS, H - y)*cell_px),
+                          range(0, H, RENDER_BAND_ROWS), pipeline.parallel(W*H*cell_px*cell_px))
+    for y, band in zip(range(0, H, RENDER_BAND_ROWS), bands):
+        rows = min(RENDER_BAND_ROWS, H - y)
+        if band_img is None or band_img.size != (W*cell_px, rows*cell_px):
+            band_img = Image.new(mode, (W*cell_px, rows*cell_px), None)
+        band_img.frombytes(band)
+        out.paste(band_img, (0, y*cell_px))
+    return out
+
+@metrics.timed('render_colored')
 def render_colored_chart(idx_map, palette_idx, cell_px):
     """Render colored pattern chart"""
     H, W = idx_map.shape
-    out = Image.new("RGB", (W*cell_px, H*cell_px), (255, 255, 255))
-    draw = ImageDraw.Draw(out)
+    colors = palette_colors(palette_idx)
+    out = Image.new("RGB", (W*cell_px, H*cell_px), None)  # every pixel is overwritten by a band
     
-    for y in range(H):
-        for x in range(W):
-            idx = int(idx_map[y, x])
-            _, _, color = palette_idx[idx]
-            x0 = x*cell_px
-            y0 = y*cell_px
-            draw.rectangle([x0, y0, x0+cell_px, y0+cell_px], fill=color)
-    
-    draw_grid(draw, W, H, cell_px)
-    return out
+    return paste_chart_bands(out, "RGB", W, H, cell_px, lambda y, h: rasterize_colors(
+        idx_map, colors, cell_px, 0, y, W*cell_px, h, HEAVY_GRID_EVERY, MEDIUM_GRID_EVERY))
 
-def render_symbol_chart(idx_map, palette_idx, cell_px, symbol_map):
-    """Render symbol pattern chart with legend"""
+def symbol_lookup(symbol_map):
+    """Dense array mapping palette indices to positions in SYMBOLS"""
+    lut = np.zeros(max(symbol_map) + 1, dtype=np.int32)
+    for idx, s in symbol_map.items():
+        lut[idx] = SYMBOLS.index(s)
+    return lut
+
+@metrics.timed('render_symbol')
+def render_symbol_chart(idx_map, palette_idx, cell_px, symbol_map, counts=None):
+    """Render symbol pattern chart with legend; counts are stitches per palette index when known"""
     H, W = idx_map.shape
     chart_w = W*cell_px
     chart_h = H*cell_px
     out = Image.new("RGB", (chart_w + LEGEND_WIDTH_PX, chart_h), (255, 255, 255))
-    draw = ImageDraw.Draw(out)
 
-    try:
-        font = ImageFont.truetype("DejaVuSansMono.ttf", int(cell_px*0.6))
-    except Exception:
-        font = ImageFont.load_default()
-
-    # Draw cells and symbols
-    for y in range(H):
-        for x in range(W):
-            idx = int(idx_map[y, x])
-            _, _, color = palette_idx[idx]
-            x0 = x*cell_px
-            y0 = y*cell_px
-            draw.rectangle([x0, y0, x0+cell_px, y0+cell_px], fill=(255, 255, 255))
-            s = symbol_map[idx]
-            tw, th = draw.textsize(s, font=font)
-            tx = x0 + (cell_px - tw)//2
-            ty = y0 + (cell_px - th)//2
-            draw.text((tx, ty), s, fill=(0, 0, 0), font=font)
-
-    draw_grid(draw, W, H, cell_px)
+    # Draw cells and symbols from the glyph atlas
+    tiles = glyph_atlas(tuple(SYMBOLS), cell_px)
+    symbol_lut = symbol_lookup(symbol_map)
+    paste_chart_bands(out, "L", W, H, cell_px, lambda y, h: rasterize_symbols(
+        idx_map, symbol_lut, tiles, cell_px, 0, y, chart_w, h, HEAVY_GRID_EVERY, MEDIUM_GRID_EVERY))
+
+    draw = ImageDraw.Draw(out)
+    font = chart_font(cell_px)
+    small_font = get_font(FONT_NAME, 12)
 
     # Legend
-    flat = idx_map.reshape(-1)
-    unique, counts = np.unique(flat, return_counts=True)
-    usage = dict(zip([int(u) for u in unique], [int(c) for c in counts]))
-    used = sorted(unique.tolist(), key=lambda u: (-usage[int(u)], u))
+    if counts is None:
+        counts = usage_counts(idx_map, max(palette_idx) + 1)
+    usage = {i: int(count) for i, count in enumerate(counts) if count}
+    used = sorted(usage, key=lambda u: (-usage[u], u))
     
     lx = chart_w + 20
     ly = 20
@@ -251,11 +495,6 @@ def render_symbol_chart(idx_map, palette_idx, cell_px, symbol_map):
         swatch_x = lx
         swatch_y = ly + 4
         draw.rectangle([swatch_x, swatch_y, swatch_x+24, swatch_y+16], fill=rgb, outline=(0, 0, 0))
-        
-        try:
-            small_font = ImageFont.truetype("DejaVuSansMono.ttf", 12)
-        except Exception:
-            small_font = ImageFont.load_default()
         draw.text((swatch_x+6, swatch_y-2), s, fill=symbol_text_color(rgb), font=small_font)
 
         text = f"{dmc}  {name}  (stitches: {usage[idx]})"
@@ -267,71 +506,618 @@ def render_symbol_chart(idx_map, palette_idx, cell_px, symbol_map):
 
     return out
 
-def create_needlepoint_pattern(image_path, canvas_size, mesh_count, max_colors=30):
-    """Convert image to needlepoint pattern with enhanced processing"""
-    try:
-        # Open image
-        img = Image.open(image_path)
-        
-        # Parse canvas size
-        width, height = canvas_size.split('x')
-        width, height = int(width), int(height)
-        
-        # Resize image to fit canvas
-        img = resize_to_stitches(img, width, height)
-        
-        # Convert to numpy array
-        img_array = np.array(img, dtype=np.uint8)
-        
-        # Get DMC palette
-        dmc_colors = get_all_dmc_colors()
-        palette_rgb = np.array([color[2] for color in dmc_colors], dtype=np.int16)
-        palette_idx = {i: (color[0], color[1], color[2]) for i, color in enumerate(dmc_colors)}
-        
-        # Map to nearest DMC colors
-        idx_map = nearest_color_indices(img_array, palette_rgb)
-        
-        # Reduce to top N colors if requested
-        if max_colors > 0:
-            idx_map = reduce_to_top_colors(idx_map, max_colors)
-        
+def usage_counts(idx_map, n_colors, band_rows=RENDER_BAND_ROWS * 4):
+    """Stitches per local palette index, counted band by band"""
+    counts = np.zeros(n_colors, dtype=np.int64)
+    for y in range(0, idx_map.shape[0], band_rows):
+        counts += np.bincount(np.asarray(idx_map[y:y + band_rows]).reshape(-1), minlength=n_colors)
+    return counts
+
+def pdf_page_starts(n_cells, per_page):
+    """First stitch of each page along one axis, neighbouring pages sharing PDF_PAGE_OVERLAP stitches"""
+    step = max(per_page - PDF_PAGE_OVERLAP, 1)
+    starts = [0]
+    while starts[-1] + per_page < n_cells:
+        starts.append(starts[-1] + step)
+    return starts
+
+def legend_pages(name, W, H, palette_idx, symbol_map, counts, page_count, page_size=PAGE_A4):
+    """PageContent for the thread key, most used threads first"""
+    page_w, page_h = page_size
+    top = page_h - PDF_MARGIN_PT - PDF_HEADER_PT - 2 * PDF_LEGEND_ROW_PT
+    per_page = max(int((top - PDF_MARGIN_PT) // PDF_LEGEND_ROW_PT), 1)
+    order = sorted((i for i in range(len(palette_idx)) if counts[i]), key=lambda i: (-counts[i], i))
+    pages = []
+    for start in range(0, max(len(order), 1), per_page):
+        page = PageContent()
+        page.text(PDF_MARGIN_PT, page_h - PDF_MARGIN_PT - 12, f"{name} - thread key", size=14)
+        page.text(PDF_MARGIN_PT, page_h - PDF_MARGIN_PT - PDF_HEADER_PT - 4,
+                  f"{W} x {H} stitches, {len(order)} colors, {page_count} chart pages", size=9)
+        y = top
+        for i in order[start:start + per_page]:
+            dmc, thread_name, rgb = palette_idx[i]
+            page.rect(PDF_MARGIN_PT, y - 3, 24, 12, fill=rgb, stroke=(0, 0, 0))
+            page.text(PDF_MARGIN_PT + 12, y, symbol_map[i], size=9, rgb=symbol_text_color(rgb), align='center')
+            page.text(PDF_MARGIN_PT + 34, y, f"DMC {dmc}", size=9)
+            page.text(PDF_MARGIN_PT + 100, y, thread_name, size=9)
+            page.text(page_w - PDF_MARGIN_PT, y, str(int(counts[i])), size=9, align='right')
+            y -= PDF_LEGEND_ROW_PT
+        pages.append(page)
+    return pages
+
+def chart_pdf(name, idx_map, palette_idx, symbol_map, style='symbol', page_size=PAGE_A4, counts=None):
+    """PDF bytes of a printable chart, yielded one page at a time
+
+    idx_map may be a memory-mapped GridBlob; each page slices only its own
+    stitches, so memory stays bounded by one rendered page. Stitch counts
+    for the thread key are counted from the grid unless given.
+    """
+    H, W = idx_map.shape
+    page_w, page_h = page_size
+    cols = max(int((page_w - 2 * PDF_MARGIN_PT - PDF_LABEL_PT) // PDF_CELL_PT), PDF_PAGE_OVERLAP + 1)
+    rows = max(int((page_h - 2 * PDF_MARGIN_PT - PDF_HEADER_PT - PDF_LABEL_PT) // PDF_CELL_PT),
+               PDF_PAGE_OVERLAP + 1)
+    xs = pdf_page_starts(W, cols)
+    ys = pdf_page_starts(H, rows)
+    left = PDF_MARGIN_PT + PDF_LABEL_PT
+    top = page_h - PDF_MARGIN_PT - PDF_HEADER_PT - PDF_LABEL_PT
+    
+    cell_px = PDF_CELL_PX
+    if style == 'symbol':
+        tiles = glyph_atlas(tuple(SYMBOLS), cell_px)
+        symbol_lut = symbol_lookup(symbol_map)
+    else:
+        colors = palette_colors(palette_idx)
+    
+    pdf = PdfWriter(title=name)
+    yield pdf.begin()
+    if counts is None:
+        counts = usage_counts(idx_map, len(palette_idx))
+    for page in legend_pages(name, W, H, palette_idx, symbol_map, counts, len(xs) * len(ys), page_size):
+        yield pdf.page(page, page_size)
+    
+    for row, sy0 in enumerate(ys):
+        for col, sx0 in enumerate(xs):
+            sx1, sy1 = min(sx0 + cols, W), min(sy0 + rows, H)
+            x0, y0 = sx0 * cell_px, sy0 * cell_px
+            w, h = (sx1 - sx0) * cell_px, (sy1 - sy0) * cell_px
+            with metrics.stage('render_pdf_page'):
+                if style == 'symbol':
+                    pixels = rasterize_symbols(idx_map, symbol_lut, tiles, cell_px, x0, y0, w, h,
+                                               HEAVY_GRID_EVERY, MEDIUM_GRID_EVERY)
+                else:
+                    pixels = rasterize_colors(idx_map, colors, cell_px, x0, y0, w, h,
+                                              HEAVY_GRID_EVERY, MEDIUM_GRID_EVERY)
+            
+            page = PageContent()
+            page.text(PDF_MARGIN_PT, page_h - PDF_MARGIN_PT - 12,
+                      f"{name} - page {row + 1}.{col + 1} of {len(ys)}.{len(xs)}: "
+                      f"columns {sx0 + 1}-{sx1}, rows {sy0 + 1}-{sy1}", size=10)
+            chart_w, chart_h = (sx1 - sx0) * PDF_CELL_PT, (sy1 - sy0) * PDF_CELL_PT
+            page.image(pixels, left, top - chart_h, chart_w, chart_h)
+            page.rect(left, top - chart_h, chart_w, chart_h, stroke=(0, 0, 0), line_width=1)
+            
+            # Number every heavy grid line with its stitch count from the chart origin
+            for k in range(-(-sx0 // HEAVY_GRID_EVERY) * HEAVY_GRID_EVERY, sx1 + 1, HEAVY_GRID_EVERY):
+                if k:
+                    page.text(left + (k - sx0) * PDF_CELL_PT, top + 4, str(k), size=7, align='center')
+            for k in range(-(-sy0 // HEAVY_GRID_EVERY) * HEAVY_GRID_EVERY, sy1 + 1, HEAVY_GRID_EVERY):
+                if k:
+                    page.text(left - 3, top - (k - sy0) * PDF_CELL_PT - 2.5, str(k), size=7, align='right')
+            yield pdf.page(page, page_size)
+    yield pdf.end()
+
+@metrics.timed('render_tile')
+def render_tile(idx_map, palette_idx, symbol_map, style, z, tx, ty):
+    """Render one TILE_SIZE chart tile at zoom level z as PNG bytes"""
+    H, W = idx_map.shape
+    cell_px = TILE_CELL_PX[z]
+    x0 = tx*TILE_SIZE
+    y0 = ty*TILE_SIZE
+    if x0 >= W*cell_px or y0 >= H*cell_px:
+        return None
+    w = min(TILE_SIZE, W*cell_px - x0)
+    h = min(TILE_SIZE, H*cell_px - y0)
+    grid = cell_px >= TILE_MIN_GRID_CELL_PX
+    
+    # Only the stitches under this tile are gathered and rasterized
+    if style == 'symbol' and cell_px >= TILE_MIN_SYMBOL_CELL_PX:
+        tiles = glyph_atlas(tuple(SYMBOLS), cell_px)
+        pixels = rasterize_symbols(idx_map, symbol_lookup(symbol_map), tiles, cell_px, x0, y0, w, h,
+                                   HEAVY_GRID_EVERY, MEDIUM_GRID_EVERY, grid)
+        tile = np.full((TILE_SIZE, TILE_SIZE), 255, dtype=np.uint8)
+    else:
+        pixels = rasterize_colors(idx_map, palette_colors(palette_idx), cell_px, x0, y0, w, h,
+                                  HEAVY_GRID_EVERY, MEDIUM_GRID_EVERY, grid)
+        tile = np.full((TILE_SIZE, TILE_SIZE, 3), 255, dtype=np.uint8)
+    tile[:h, :w] = pixels
+    
+    buf = io.BytesIO()
+    Image.fromarray(tile).save(buf, format='PNG')
+    return buf.getvalue()
+
+def data_version(pattern_data):
+    """Short content hash of stored pattern data"""
+    return hashlib.sha1(pattern_data.encode('utf-8')).hexdigest()[:16]
+
+def pattern_query(*columns):
+    """Pattern query loading only the id, the owner and the given columns"""
+    return Pattern.query.options(load_only(Pattern.user_id, *columns))
+
+def pattern_version(pattern):
+    """Short content hash identifying the current state of a saved pattern"""
+    return data_version(pattern.pattern_data)
+
+def externalize_grid(data):
+    """Pattern data with its grid moved to the blob store, leaving a 'grid_ref'"""
+    pattern = data['pattern']
+    if 'grid' not in pattern:
+        return data
+    grid = decode_grid(pattern)
+    stored = {k: v for k, v in pattern.items() if k != 'grid'}
+    if not valid_usage(stored.get('usage'), len(pattern['palette']), grid.size):
+        stored['usage'] = usage_index(grid, len(pattern['palette']))
+    stored['grid_ref'] = blob_store.put_grid(grid)
+    return {**data, 'pattern': stored}
+
+def inline_grid(data):
+    """Pattern data with the grid embedded again, for clients"""
+    pattern = data['pattern']
+    if 'grid_ref' not in pattern:
+        return data
+    inlined = {k: v for k, v in pattern.items() if k != 'grid_ref'}
+    _, inlined['grid'] = encode_grid(pattern_grid(pattern), len(pattern['palette']))
+    return {**data, 'pattern': inlined}
+
+def pattern_grid(pattern, lazy=False):
+    """Index grid of a compact pattern; lazy returns the memory-mapped blob for stored grids"""
+    if 'grid_ref' in pattern:
+        blob = blob_store.grid(pattern['grid_ref'])
+        return blob if lazy else np.asarray(blob)
+    return decode_grid(pattern)
+
+@lru_cache(maxsize=32)
+def pattern_layout(raw):
+    """Pattern table, palette lookup and symbol map of stored pattern data, without the grid"""
+    pattern = load_pattern_data(raw)['pattern']
+    return pattern, palette_lookup(pattern), local_symbol_map(pattern)
+
+@lru_cache(maxsize=8)
+def decoded_pattern(raw):
+    """Index grid, palette lookup and symbol map of stored pattern data"""
+    pattern, palette_idx, symbol_map = pattern_layout(raw)
+    return pattern_grid(pattern), palette_idx, symbol_map
+
+def windowed_pattern(raw):
+    """Like decoded_pattern, but stored grids stay memory-mapped and are read band by band"""
+    pattern, palette_idx, symbol_map = pattern_layout(raw)
+    if 'grid_ref' in pattern:
+        return pattern_grid(pattern, lazy=True), palette_idx, symbol_map
+    return decoded_pattern(raw)
+
+@lru_cache(maxsize=32)
+def pattern_usage(raw):
+    """Usage index of stored pattern data, computed from the grid for patterns saved without one"""
+    pattern = pattern_layout(raw)[0]
+    usage = pattern.get('usage')
+    if valid_usage(usage, len(pattern['palette']), pattern['width'] * pattern['height']):
+        return usage
+    return usage_index(pattern_grid(pattern), len(pattern['palette']))
+
+def usage_rows(pattern, usage, mesh_count, stitch=DEFAULT_STITCH, strands=None):
+    """Per-thread counts, extent and thread estimate of a pattern, most used first"""
+    rows = []
+    for (dmc, name, rgb, symbol), count, bbox, regions in zip(pattern['palette'], usage['counts'],
+                                                              usage['bbox'], usage['regions']):
+        metres, skeins = thread_estimate(count, mesh_count, stitch, strands, regions)
+        rows.append({'dmc': dmc, 'name': name, 'rgb': rgb, 'symbol': symbol, 'count': count, 'bbox': bbox,
+                     'regions': regions, 'metres': round(metres, 2), 'skeins': skeins})
+    return sorted(rows, key=lambda row: -row['count'])
+
+def owned_threads(user_id):
+    """Thread numbers mentioned in the names of a user's thread supplies"""
+    owned = set()
+    for supply in Supply.query.filter_by(user_id=user_id, type='thread'):
+        owned.update(re.findall(r'\w*\d\w*', supply.name))
+    return owned
+
+def move_grids_to_blob_store(batch_size=100):
+    """Rewrite patterns saved with an inline grid to reference a blob instead"""
+    moved = 0
+    last_id = 0
+    while True:
+        batch = (Pattern.query.options(load_only(Pattern.id, Pattern.pattern_data))
+                 .filter(Pattern.id > last_id).order_by(Pattern.id).limit(batch_size).all())
+        if not batch:
+            return moved
+        for pattern in batch:
+            data = load_pattern_data(pattern.pattern_data)
+            if 'grid' in data['pattern']:
+                pattern.pattern_data = json.dumps(externalize_grid(data))
+                moved += 1
+        last_id = batch[-1].id
+        db.session.commit()
+
+def index_pattern_usage(batch_size=100):
+    """Store a usage index in patterns saved before conversions computed one"""
+    indexed = 0
+    last_id = 0
+    while True:
+        batch = (Pattern.query.options(load_only(Pattern.id, Pattern.pattern_data))
+                 .filter(Pattern.id > last_id).order_by(Pattern.id).limit(batch_size).all())
+        if not batch:
+            return indexed
+        for pattern in batch:
+            data = load_pattern_data(pattern.pattern_data)
+            layout = data['pattern']
+            if not valid_usage(layout.get('usage'), len(layout['palette']), layout['width'] * layout['height']):
+                layout['usage'] = usage_index(pattern_grid(layout), len(layout['palette']))
+                pattern.pattern_data = json.dumps(data)
+                indexed += 1
+        last_id = batch[-1].id
+        db.session.commit()
+
+def pattern_thumbnail(idx_map, palette_idx):
+    """Small PNG preview of a pattern, one pixel per stitch scaled to THUMBNAIL_PX"""
+    # Large patterns are sampled down to about twice the thumbnail size before coloring
+    step = max(1, max(idx_map.shape) // (2 * THUMBNAIL_PX))
+    img = Image.fromarray(palette_colors(palette_idx)[idx_map[::step, ::step]])
+    img.thumbnail((THUMBNAIL_PX, THUMBNAIL_PX), Image.Resampling.BOX)
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+def build_pattern_summary(pattern):
+    """Summary row with thumbnail and stats for a saved pattern"""
+    idx_map, palette_idx, _ = decoded_pattern(pattern.pattern_data)
+    H, W = idx_map.shape
+    done, _ = decode_progress(pattern.progress_data, W, H)
+    return PatternSummary(
+        pattern_id=pattern.id,
+        width=W,
+        height=H,
+        color_count=len(palette_idx),
+        stitches_done=int(done.sum()),
+        thumbnail=pattern_thumbnail(idx_map, palette_idx)
+    )
+
+def gallery_page(user_id, folder_id=None, cursor=None):
+    """One page of a user's patterns, newest first, without the large columns"""
+    query = Pattern.query.options(load_only(
+        Pattern.id, Pattern.folder_id, Pattern.name, Pattern.canvas_size, Pattern.mesh_count, Pattern.created_at
+    )).filter(Pattern.user_id == user_id)
+    if folder_id is not None:
+        query = query.filter(Pattern.folder_id == folder_id)
+    
+    # Keyset pagination on (created_at, id) stays fast however deep the page
+    if cursor:
+        created_at, pattern_id = cursor.rsplit('_', 1)
+        created_at = datetime.fromisoformat(created_at)
+        pattern_id = int(pattern_id)
+        query = query.filter(or_(Pattern.created_at < created_at,
+                                 and_(Pattern.created_at == created_at, Pattern.id < pattern_id)))
+    
+    patterns = query.order_by(Pattern.created_at.desc(), Pattern.id.desc()).limit(GALLERY_PAGE_SIZE + 1).all()
+    next_cursor = None
+    if len(patterns) > GALLERY_PAGE_SIZE:
+        patterns = patterns[:GALLERY_PAGE_SIZE]
+        next_cursor = f"{patterns[-1].created_at.isoformat()}_{patterns[-1].id}"
+    return patterns, next_cursor
+
+def pattern_summaries(patterns):
+    """Summary rows keyed by pattern id, built for patterns saved before summaries existed"""
+    ids = [p.id for p in patterns]
+    summaries = {s.pattern_id: s for s in PatternSummary.query.filter(PatternSummary.pattern_id.in_(ids))}
+    missing = [pattern_id for pattern_id in ids if pattern_id not in summaries]
+    if missing:
+        for pattern in Pattern.query.filter(Pattern.id.in_(missing)):
+            summaries[pattern.id] = build_pattern_summary(pattern)
+            db.session.add(summaries[pattern.id])
+        db.session.commit()
+    return summaries
+
+def job_owner():
+    """Key that per-user job limits and job access are checked against"""
+    if current_user.is_authenticated:
+        return f"user:{current_user.id}"
+    return f"addr:{request.remote_addr}"
+
+def pattern_cache_key(image_hash, width, height, max_colors, metric, reduce_mode, dither='none'):
+    """Result cache key; identical image and settings give an identical pattern"""
+    return cache_key('pattern', image_hash, width, height, max_colors, metric, reduce_mode, dither,
+                     palette_version(), PATTERN_ALGORITHM_VERSION)
+
+def cached_pattern(key, mesh_count):
+    """Previously converted pattern for a cache key, or None"""
+    cached = result_cache.get(key)
+    if cached is None:
+        return None
+    result = json.loads(cached)
+    result['symbol_map'] = {int(idx): s for idx, s in result['symbol_map'].items()}
+    result['mesh_count'] = mesh_count
+    return result
+
+def dither_grid(grid, palette_rgb, mode, metric=DEFAULT_METRIC):
+    """Dithered palette indices for a stitch grid
+
+    Ordered dithering only depends on position, so it runs in row bands;
+    error diffusion carries error from row to row and stays serial.
+    """
+    if mode != 'ordered':
+        return dither_indices(grid, palette_rgb, mode, metric)
+    H, W, _ = grid.shape
+    out = np.empty((H, W), dtype=np.int64)
+    def dither_band(band):
+        out[band[0]:band[1]] = dither_indices(grid[band[0]:band[1]], palette_rgb, mode, metric)
+    pipeline.map(dither_band, pipeline.split(H, W))
+    return out
+
+def finish_pattern(idx_map, palette_rgb, palette_idx, mesh_count, max_colors, metric, reduce_mode, key,
+                   grid=None, dither='none'):
+    """Reduce colors of a matched stitch grid and build the pattern result"""
+    height, width = idx_map.shape
+    
+    # Reduce to top N colors if requested
+    if max_colors > 0:
+        idx_map = reduce_to_top_colors(idx_map, max_colors, palette_rgb, metric, reduce_mode)
+    
+    # Re-map the source pixels onto the kept colors, spreading the error
+    if dither != 'none' and grid is not None:
+        with metrics.stage('dither'):
+            kept = np.flatnonzero(pipeline.bincount(idx_map, len(palette_rgb)))
+            idx_map = kept[dither_grid(grid, palette_rgb[kept], dither, metric)]
+    
+    with metrics.stage('build') as stage:
         # Get used colors and create symbol map
-        flat = idx_map.reshape(-1)
-        used = sorted(np.unique(flat).tolist())
-        symbol_map = build_symbol_map(used)
+        used = np.flatnonzero(pipeline.bincount(idx_map, len(palette_rgb)))
+        symbol_map = build_symbol_map(used.tolist())
         
-        # Create pattern data
-        pattern = []
-        colors_used = []
+        # Colors in order of first appearance, scanning row by row
+        colors_used = [palette_idx[int(i)][0] for i in pipeline.first_seen(idx_map)]
         
-        for y in range(height):
-            row = []
-            for x in range(width):
-                idx = int(idx_map[y, x])
-                dmc_num, dmc_name, rgb = palette_idx[idx]
-                row.append({
-                    'dmc': dmc_num,
-                    'name': dmc_name,
-                    'rgb': rgb,
-                    'symbol': symbol_map[idx]
-                })
-                if dmc_num not in colors_used:
-                    colors_used.append(dmc_num)
-            pattern.append(row)
+        # Create compact pattern data
+        pattern = encode_pattern(idx_map, palette_idx, symbol_map, used)
+        pattern['usage'] = usage_index(decode_grid(pattern), len(pattern['palette']))
+        stage.nbytes = len(pattern['grid'])
+    
+    result = {
+        'pattern': pattern,
+        'colors_used': colors_used,
+        'symbol_map': symbol_map,
+        'width': width,
+        'height': height,
+        'mesh_count': mesh_count
+    }
+    with metrics.stage('serialize') as stage:
+        encoded = json.dumps(result).encode('utf-8')
+        stage.nbytes = len(encoded)
+    result_cache.put(key, encoded)
+    return result
+
+def convert_grid(img_array, mesh_count, max_colors, metric, reduce_mode, key, dither):
+    """Pattern for an RGB stitch grid, stored in the result cache under key"""
+    palette_rgb, palette_idx = dmc_palette()
+    idx_map = nearest_color_indices(img_array, palette_rgb, metric)
+    return finish_pattern(idx_map, palette_rgb, palette_idx, mesh_count, max_colors, metric, reduce_mode, key,
+                          img_array, dither)
+
+def create_needlepoint_pattern(image_path, canvas_size, mesh_count, max_colors=30, metric=DEFAULT_METRIC,
+                               reduce_mode='frequency', image_hash=None, dither='none'):
+    """Convert image to needlepoint pattern with enhanced processing"""
+    try:
+        # Parse canvas size
+        width, height = parse_canvas_size(canvas_size)
         
-        return {
-            'pattern': pattern,
-            'colors_used': colors_used,
-            'symbol_map': symbol_map,
-            'width': width,
-            'height': height,
-            'mesh_count': mesh_count
-        }
+        if image_hash is None:
+            image_hash = file_sha256(image_path)
+        with conversion_source(image_path, image_hash) as (source, source_hash):
+            key = pattern_cache_key(source_hash, width, height, max_colors, metric, reduce_mode, dither)
+            result = cached_pattern(key, mesh_count)
+            if result is not None:
+                return result
+            
+            # Open and resize image to fit canvas
+            img_array = stitch_grid(source, source_hash, width, height)
+        return convert_grid(img_array, mesh_count, max_colors, metric, reduce_mode, key, dither)
         
-    except Exception as e:
-        print(f"Error creating pattern: {e}")
+    except Exception:
+        app.logger.exception("Error creating pattern from %s", image_path)
+        metrics.count_error('create_pattern')
         return None
 
+def convert_variants(image_path, image_hash, variants, metric=DEFAULT_METRIC, reduce_mode='frequency',
+                     dither='none'):
+    """Convert one image under several (width, height, max_colors, mesh_count) variants
+
+    The image is decoded once, each distinct canvas size is palette-matched
+    once, and canvas sizes are processed in parallel.
+    """
+    results = [None] * len(variants)
+    groups = {}
+    with conversion_source(image_path, image_hash) as (source, source_hash):
+        for i, (width, height, max_colors, mesh_count) in enumerate(variants):
+            key = pattern_cache_key(source_hash, width, height, max_colors, metric, reduce_mode, dither)
+            results[i] = cached_pattern(key, mesh_count)
+            if results[i] is None:
+                groups.setdefault((width, height), []).append((i, max_colors, mesh_count, key))
+        if not groups:
+            return results
+        
+        grids = stitch_grids(source, source_hash, list(groups))
+    palette_rgb, palette_idx = dmc_palette()
+    
+    def convert_size(size):
+        try:
+            idx_map = nearest_color_indices(grids[size], palette_rgb, metric)
+            for i, max_colors, mesh_count, key in groups[size]:
+                results[i] = finish_pattern(idx_map, palette_rgb, palette_idx, mesh_count, max_colors, metric,
+                                            reduce_mode, key, grids[size], dither)
+        except Exception:
+            app.logger.exception("Error creating %dx%d pattern variants from %s", *size, image_path)
+            metrics.count_error('create_pattern')
+    
+    # Each size runs in a copy of this context so its stages join the request trace
+    with ThreadPoolExecutor(max_workers=min(len(groups), os.cpu_count() or 1)) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, convert_size, size) for size in groups]
+        for future in futures:
+            future.result()
+    return results
+
+def preview_size(width, height):
+    """Coarse stitch grid size with the canvas aspect ratio"""
+    scale = min(1.0, PREVIEW_MAX_STITCHES / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def sse_event(event, data):
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def stream_conversion(filepath, image_hash, params, canvas_size, mesh_count, max_colors, metric, reduce_mode,
+                      dither):
+    """Server-Sent Events for a progressive conversion: preview, palette, bands, done
+
+    The coarse preview is resized and sent first; the full grid is resized
+    from the same decode afterwards. A cached pattern is sent without a
+    preview. The full pattern is sent as its palette table followed by row
+    bands of the packed index grid.
+    """
+    try:
+        width, height = parse_canvas_size(canvas_size)
+        with conversion_source(filepath, image_hash) as (source, source_hash):
+            key = pattern_cache_key(source_hash, width, height, max_colors, metric, reduce_mode, dither)
+            pattern_data = cached_pattern(key, mesh_count)
+            if pattern_data is None:
+                small = preview_size(width, height)
+                grids = iter_stitch_grids(source, source_hash, [small, (width, height)])
+                palette_rgb, palette_idx = dmc_palette()
+                
+                # Matching and reduction are timed stages of their own
+                idx_map = nearest_color_indices(next(grids)[1], palette_rgb, metric)
+                if max_colors > 0:
+                    idx_map = reduce_to_top_colors(idx_map, max_colors, palette_rgb, metric)
+                with metrics.stage('preview') as stage:
+                    # The preview is drawn as colors only, so it carries no symbols
+                    preview = encode_pattern(idx_map, palette_idx, dict.fromkeys(np.unique(idx_map).tolist(), ''))
+                    stage.nbytes = len(preview['grid'])
+                yield sse_event('preview', {'pattern': preview})
+                
+                pattern_data = convert_grid(next(grids)[1], mesh_count, max_colors, metric, reduce_mode, key, dither)
+            
+        pattern = pattern_data['pattern']
+        yield sse_event('palette', {**pattern_data, 'pattern': {k: v for k, v in pattern.items() if k != 'grid'}})
+        grid = decode_grid(pattern)
+        for y0 in range(0, pattern['height'], STREAM_BAND_ROWS):
+            _, band = encode_grid(grid[y0:y0 + STREAM_BAND_ROWS], len(pattern['palette']))
+            yield sse_event('band', {'y': y0, 'rows': min(STREAM_BAND_ROWS, pattern['height'] - y0), 'grid': band})
+        yield sse_event('done', {'success': True, **params})
+    except Exception:
+        app.logger.exception("Error streaming pattern from %s", filepath)
+        metrics.count_error('stream_pattern')
+        yield sse_event('error', {'error': 'Failed to create pattern'})
+
+def pattern_preview(pattern):
+    """PNG data URL thumbnail of a compact pattern"""
+    png = pattern_thumbnail(decode_grid(pattern), palette_lookup(pattern))
+    return 'data:image/png;base64,' + base64.b64encode(png).decode('ascii')
+
+def store_upload(file):
+    """Save an uploaded image under its content hash; returns (filename, path, sha256)
+
+    The hash is of the bytes as uploaded. Large or rotated originals are
+    stored as uploaded and replaced by a downscaled, upright working copy in
+    the background; the file name already has the working copy's extension.
+    """
+    image_bytes = file.read()
+    probe_image(io.BytesIO(image_bytes), app.config['MAX_IMAGE_PIXELS'])
+    image_hash = hashlib.sha256(image_bytes).hexdigest()
+    extension = file.filename.rsplit('.', 1)[1].lower()
+    
+    # Re-uploads of the same image share one file
+    for candidate in (extension, 'jpg', 'png'):
+        unique_filename = f"{image_hash}.{candidate}"
+        if upload_store.exists(unique_filename):
+            upload_store.touch(unique_filename)
+            return unique_filename, upload_store.path(unique_filename), image_hash
+    
+    copy_extension = working_copy_extension(io.BytesIO(image_bytes), app.config['UPLOAD_WORKING_MAX_SIDE'])
+    unique_filename = f"{image_hash}.{copy_extension or extension}"
+    path = upload_store.put(unique_filename, image_bytes, job_owner())
+    if copy_extension is not None:
+        working_copies.submit(store_working_copy, unique_filename)
+    return unique_filename, path, image_hash
+
+def store_working_copy(filename):
+    """Replace a stored upload with its working copy (a no-op once it is one)"""
+    try:
+        copy = working_copy(upload_store.path(filename), app.config['UPLOAD_WORKING_MAX_SIDE'])
+        if copy is not None:
+            upload_store.rewrite(filename, copy[0])
+    except Exception:
+        app.logger.exception("Failed to store a working copy of %s", filename)
+
+def conversion_options(form):
+    """Validated (metric, reduce_mode, dither) from request form data"""
+    metric = form.get('metric', DEFAULT_METRIC)
+    if metric not in METRICS:
+        raise ValueError(f"Unknown color metric '{metric}'")
+    reduce_mode = form.get('reduce_mode', 'frequency')
+    if reduce_mode not in REDUCE_MODES:
+        raise ValueError(f"Unknown color reduction mode '{reduce_mode}'")
+    dither = form.get('dither', 'none')
+    if dither not in DITHER_MODES:
+        raise ValueError(f"Unknown dither mode '{dither}'")
+    return metric, reduce_mode, dither
+
+@app.before_request
+def start_request_metrics():
+    if metrics.enabled:
+        g.request_started = time.perf_counter()
+        if request.headers.get('X-Trace') == '1':
+            metrics.start_trace()
+            g.tracing = True
+
+@app.after_request
+def finish_request_metrics(response):
+    # A streamed body has not been produced yet; stream_request_metrics records it
+    if g.get('streamed'):
+        return response
+    started = g.get('request_started')
+    if started is not None:
+        metrics.observe_request(request.endpoint, request.method, response.status_code,
+                                time.perf_counter() - started, response.content_length)
+    if g.get('tracing'):
+        spans = metrics.stop_trace()
+        if spans:
+            response.headers['Server-Timing'] = server_timing(spans)
+    return response
+
+def stream_request_metrics(events):
+    """Pass SSE events through, recording request metrics once the last one is sent
+
+    Headers go out before the first event, so a traced stream ends with a
+    'timing' event carrying the Server-Timing value instead of the header.
+    """
+    started = g.get('request_started')
+    tracing = g.get('tracing')
+    sent = 0
+    try:
+        for event in events:
+            sent += len(event.encode('utf-8'))
+            yield event
+        if tracing:
+            yield sse_event('timing', {'server_timing': server_timing(metrics.stop_trace())})
+    finally:
+        if started is not None:
+            metrics.observe_request(request.endpoint, request.method, 200, time.perf_counter() - started, sent)
+        if tracing:
+            metrics.stop_trace()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -392,28 +1178,52 @@ def upload():
         
         if file and allowed_file(file.filename):
             # Save original image
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4()}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(filepath)
+            try:
+                unique_filename, filepath, image_hash = store_upload(file)
+            except ImageRejected as e:
+                return jsonify({'error': str(e)}), 400
             
             # Get parameters
             canvas_size = request.form.get('canvas_size', '100x100')
             mesh_count = int(request.form.get('mesh_count', 14))
             max_colors = int(request.form.get('max_colors', 30))
+            try:
+                parse_canvas_size(canvas_size)
+                metric, reduce_mode, dither = conversion_options(request.form)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-            # Create pattern
-            pattern_data = create_needlepoint_pattern(filepath, canvas_size, mesh_count, max_colors)
+            params = {
+                'original_image': unique_filename,
+                'canvas_size': canvas_size,
+                'mesh_count': mesh_count,
+                'max_colors': max_colors,
+                'metric': metric,
+                'reduce_mode': reduce_mode,
+                'dither': dither
+            }
+            args = (filepath, canvas_size, mesh_count, max_colors, metric, reduce_mode, image_hash, dither)
             
-            if pattern_data:
+            # Hand the conversion to the worker pool and let the client poll
+            if request.form.get('async') == '1':
+                try:
+                    job = jobs.submit(job_owner(), create_needlepoint_pattern, *args, meta=params)
+                except JobRejected as e:
+                    response = jsonify({'error': str(e)})
+                    response.headers['Retry-After'] = '5'
+                    return response, 429
                 return jsonify({
                     'success': True,
-                    'pattern_data': pattern_data,
-                    'original_image': unique_filename,
-                    'canvas_size': canvas_size,
-                    'mesh_count': mesh_count,
-                    'max_colors': max_colors
-                })
+                    'job_id': job.id,
+                    'status': job.status,
+                    'status_url': url_for('job_status', job_id=job.id)
+                }), 202
+            
+            # Create pattern
+            pattern_data = create_needlepoint_pattern(*args)
+            
+            if pattern_data:
+                return jsonify({'success': True, 'pattern_data': pattern_data, **params})
             else:
                 return jsonify({'error': 'Failed to create pattern'}), 500
         
@@ -421,16 +1231,139 @@ def upload():
     
     return render_template('upload.html')
 
+@app.route('/upload/stream', methods=['POST'])
+def upload_stream():
+    file = request.files.get('image')
+    if not file or not file.filename:
+        return jsonify({'error': 'No image uploaded'}), 400
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    try:
+        unique_filename, filepath, image_hash = store_upload(file)
+    except ImageRejected as e:
+        return jsonify({'error': str(e)}), 400
+    
+    canvas_size = request.form.get('canvas_size', '100x100')
+    mesh_count = int(request.form.get('mesh_count', 14))
+    max_colors = int(request.form.get('max_colors', 30))
+    try:
+        parse_canvas_size(canvas_size)
+        metric, reduce_mode, dither = conversion_options(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    params = {
+        'original_image': unique_filename,
+        'canvas_size': canvas_size,
+        'mesh_count': mesh_count,
+        'max_colors': max_colors,
+        'metric': metric,
+        'reduce_mode': reduce_mode,
+        'dither': dither
+    }
+    events = stream_conversion(filepath, image_hash, params, canvas_size, mesh_count, max_colors, metric,
+                               reduce_mode, dither)
+    g.streamed = True
+    return Response(stream_with_context(stream_request_metrics(events)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    files = [f for f in request.files.getlist('image') if f.filename]
+    if not files:
+        return jsonify({'error': 'No image uploaded'}), 400
+    if len(files) > BATCH_MAX_IMAGES:
+        return jsonify({'error': f"At most {BATCH_MAX_IMAGES} images per batch"}), 400
+    if not all(allowed_file(f.filename) for f in files):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    # Variants: [{"canvas_size": "100x100", "max_colors": 30, "mesh_count": 14}, ...]
+    mesh_count = int(request.form.get('mesh_count', 14))
+    try:
+        metric, reduce_mode, dither = conversion_options(request.form)
+        variants = []
+        for v in json.loads(request.form.get('variants', '[]')):
+            width, height = parse_canvas_size(v.get('canvas_size', '100x100'))
+            variants.append((width, height, int(v.get('max_colors', 30)), int(v.get('mesh_count', mesh_count))))
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f"Invalid variants: {e}"}), 400
+    if not variants or len(variants) > BATCH_MAX_VARIANTS:
+        return jsonify({'error': f"Between 1 and {BATCH_MAX_VARIANTS} variants are required"}), 400
+    
+    results = []
+    for image_index, file in enumerate(files):
+        try:
+            unique_filename, filepath, image_hash = store_upload(file)
+        except ImageRejected as e:
+            return jsonify({'error': str(e)}), 400
+        
+        converted = convert_variants(filepath, image_hash, variants, metric, reduce_mode, dither)
+        for (width, height, max_colors, variant_mesh), pattern_data in zip(variants, converted):
+            item = {
+                'image_index': image_index,
+                'original_image': unique_filename,
+                'canvas_size': f"{width}x{height}",
+                'mesh_count': variant_mesh,
+                'max_colors': max_colors,
+                'metric': metric,
+                'reduce_mode': reduce_mode,
+                'dither': dither
+            }
+            if pattern_data is None:
+                item['error'] = 'Failed to create pattern'
+            else:
+                item['pattern_data'] = pattern_data
+                item['preview'] = pattern_preview(pattern_data['pattern'])
+            results.append(item)
+    
+    return jsonify({'success': True, 'results': results})
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_status(job_id):
+    job = jobs.get(job_id, job_owner())
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    if request.method == 'DELETE':
+        return jsonify({'success': True, 'job_id': job.id, 'status': jobs.cancel(job)})
+    
+    status = job.status
+    data = {'job_id': job.id, 'status': status}
+    if status == 'done':
+        data['result_url'] = url_for('job_result', job_id=job.id)
+    return jsonify(data)
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    job = jobs.get(job_id, job_owner())
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    
+    status = job.status
+    if status in ('queued', 'running'):
+        return jsonify({'job_id': job.id, 'status': status}), 202
+    if status == 'cancelled':
+        return jsonify({'error': 'Job was cancelled', 'status': status}), 409
+    pattern_data = jobs.result(job)
+    if pattern_data is None:
+        return jsonify({'error': 'Failed to create pattern', 'status': status}), 500
+    
+    return jsonify({'success': True, 'pattern_data': pattern_data, **job.meta})
+
 @app.route('/save_pattern', methods=['POST'])
 @login_required
 def save_pattern():
     data = request.get_json()
+    folder_id = data.get('folder_id') or None
+    if folder_id is not None and Folder.query.filter_by(id=folder_id, user_id=current_user.id).first() is None:
+        return jsonify({'error': 'Folder not found'}), 404
     
     pattern = Pattern(
         user_id=current_user.id,
+        folder_id=folder_id,
         name=data['name'],
         original_image=data['original_image'],
-        pattern_data=json.dumps(data['pattern_data']),
+        pattern_data=json.dumps(externalize_grid(load_pattern_data(data['pattern_data']))),
         canvas_size=data['canvas_size'],
         mesh_count=data['mesh_count'],
         colors_used=json.dumps(data['colors_used'])
@@ -438,15 +1371,63 @@ def save_pattern():
     
     db.session.add(pattern)
     db.session.commit()
+    db.session.add(build_pattern_summary(pattern))
+    db.session.commit()
     
     return jsonify({'success': True, 'pattern_id': pattern.id})
 
 @app.route('/gallery')
 @login_required
 def gallery():
-    patterns = Pattern.query.filter_by(user_id=current_user.id).all()
+    folder_id = request.args.get('folder', type=int)
+    try:
+        patterns, next_cursor = gallery_page(current_user.id, folder_id, request.args.get('cursor'))
+    except ValueError:
+        return redirect(url_for('gallery'))
+    summaries = pattern_summaries(patterns)
     folders = Folder.query.filter_by(user_id=current_user.id).all()
-    return render_template('gallery.html', patterns=patterns, folders=folders)
+    return render_template('gallery.html', patterns=patterns, folders=folders, summaries=summaries,
+                           folder_id=folder_id, next_cursor=next_cursor)
+
+@app.route('/gallery/patterns')
+@login_required
+def gallery_patterns():
+    folder_id = request.args.get('folder', type=int)
+    try:
+        patterns, next_cursor = gallery_page(current_user.id, folder_id, request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    summaries = pattern_summaries(patterns)
+    
+    items = []
+    for pattern in patterns:
+        items.append({
+            'id': pattern.id,
+            'name': pattern.name,
+            'folder_id': pattern.folder_id,
+            'canvas_size': pattern.canvas_size,
+            'mesh_count': pattern.mesh_count,
+            'created_at': pattern.created_at.isoformat(),
+            'thumbnail_url': url_for('pattern_thumbnail_png', pattern_id=pattern.id),
+            **summaries[pattern.id].to_dict()
+        })
+    return jsonify({'patterns': items, 'next_cursor': next_cursor})
+
+@app.route('/pattern/<int:pattern_id>/thumbnail.png')
+@login_required
+def pattern_thumbnail_png(pattern_id):
+    summary = (PatternSummary.query
+               .options(load_only(PatternSummary.thumbnail, PatternSummary.updated_at))
+               .join(Pattern, Pattern.id == PatternSummary.pattern_id)
+               .filter(PatternSummary.pattern_id == pattern_id, Pattern.user_id == current_user.id)
+               .first())
+    if summary is None:
+        return jsonify({'error': 'Unknown pattern'}), 404
+    
+    response = send_file(io.BytesIO(summary.thumbnail), mimetype='image/png',
+                         etag=f"{pattern_id}-{summary.updated_at.timestamp()}")
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
 
 @app.route('/pattern/<int:pattern_id>')
 @login_required
@@ -455,9 +1436,11 @@ def view_pattern(pattern_id):
     if pattern.user_id != current_user.id:
         return redirect(url_for('gallery'))
     
-    pattern_data = json.loads(pattern.pattern_data)
+    pattern_data = inline_grid(load_pattern_data(pattern.pattern_data))
     colors_used = json.loads(pattern.colors_used)
-    progress_data = json.loads(pattern.progress_data) if pattern.progress_data else []
+    idx_map, _, _ = decoded_pattern(pattern.pattern_data)
+    done, version = current_progress(pattern, idx_map.shape[1], idx_map.shape[0])
+    progress_data = encode_progress(done, version)
     
     return render_template('pattern_view.html', 
                          pattern=pattern, 
@@ -465,6 +1448,364 @@ def view_pattern(pattern_id):
                          colors_used=colors_used,
                          progress_data=progress_data)
 
+@app.route('/pattern/<int:pattern_id>/export.pdf')
+@login_required
+def export_pattern_pdf(pattern_id):
+    style = request.args.get('style', 'symbol')
+    if style not in ('color', 'symbol'):
+        return jsonify({'error': f"Unknown chart style '{style}'"}), 400
+    
+    pattern = pattern_query(Pattern.name, Pattern.pattern_data).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    idx_map, palette_idx, symbol_map = windowed_pattern(pattern.pattern_data)
+    counts = pattern_usage(pattern.pattern_data)['counts']
+    response = Response(chart_pdf(pattern.name, idx_map, palette_idx, symbol_map, style, counts=counts),
+                        mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="pattern-{pattern.id}.pdf"'
+    return response
+
+def estimate_options(args):
+    """(stitch, strands) from query arguments; raises ValueError for bad values"""
+    stitch = args.get('stitch', DEFAULT_STITCH)
+    if stitch not in STITCH_TYPES:
+        raise ValueError(f"Unknown stitch type '{stitch}'")
+    strands = args.get('strands', type=int)
+    if strands is not None and strands <= 0:
+        raise ValueError("Strands must be positive")
+    return stitch, strands
+
+@app.route('/pattern/<int:pattern_id>/usage')
+@login_required
+def pattern_thread_usage(pattern_id):
+    pattern = pattern_query(Pattern.pattern_data, Pattern.mesh_count).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    try:
+        stitch, strands = estimate_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    layout = pattern_layout(pattern.pattern_data)[0]
+    rows = usage_rows(layout, pattern_usage(pattern.pattern_data), pattern.mesh_count, stitch, strands)
+    owned = owned_threads(current_user.id)
+    for row in rows:
+        row['skeins'] = math.ceil(row['skeins'])
+        row['owned'] = str(row['dmc']) in owned
+    return jsonify({
+        'stitch': stitch,
+        'strands': strands or strands_for_mesh(pattern.mesh_count),
+        'mesh_count': pattern.mesh_count,
+        'threads': rows,
+        'total_skeins': sum(row['skeins'] for row in rows)
+    })
+
+@app.route('/shopping_list')
+@login_required
+def shopping_list():
+    try:
+        stitch, strands = estimate_options(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = Pattern.query.options(load_only(Pattern.id, Pattern.pattern_data, Pattern.mesh_count)) \
+        .filter(Pattern.user_id == current_user.id)
+    folder_id = request.args.get('folder', type=int)
+    if folder_id is not None:
+        query = query.filter(Pattern.folder_id == folder_id)
+    
+    # Totals per catalogue row; threads outside the catalogue are summed by number
+    catalogue = get_palette('dmc')
+    counts = np.zeros(len(catalogue), dtype=np.int64)
+    skeins = np.zeros(len(catalogue))
+    used_in = np.zeros(len(catalogue), dtype=np.int64)
+    others = {}
+    patterns = 0
+    for pattern in query.order_by(Pattern.id):
+        patterns += 1
+        layout = pattern_layout(pattern.pattern_data)[0]
+        rows = usage_rows(layout, pattern_usage(pattern.pattern_data), pattern.mesh_count, stitch, strands)
+        at = catalogue.rows([row['dmc'] if isinstance(row['dmc'], int) else -1 for row in rows])
+        known = at >= 0
+        np.add.at(counts, at[known], np.array([row['count'] for row in rows], dtype=np.int64)[known])
+        np.add.at(skeins, at[known], np.array([row['skeins'] for row in rows])[known])
+        np.add.at(used_in, at[known], 1)
+        for row in (row for row, k in zip(rows, known) if not k):
+            entry = others.setdefault(row['dmc'], {'dmc': row['dmc'], 'name': row['name'], 'rgb': row['rgb'],
+                                                  'count': 0, 'skeins': 0.0, 'patterns': 0})
+            entry['count'] += row['count']
+            entry['skeins'] += row['skeins']
+            entry['patterns'] += 1
+    
+    threads = [{'dmc': dmc, 'name': name, 'rgb': list(rgb), 'count': int(counts[i]), 'skeins': float(skeins[i]),
+                'patterns': int(used_in[i])}
+               for i, (dmc, name, rgb) in ((int(i), catalogue.colors[i]) for i in np.flatnonzero(used_in))]
+    owned = owned_threads(current_user.id)
+    rows = sorted(threads + list(others.values()), key=lambda entry: -entry['count'])
+    for row in rows:
+        row['skeins'] = math.ceil(row['skeins'])
+        row['owned'] = str(row['dmc']) in owned
+    return jsonify({'stitch': stitch, 'patterns': patterns, 'threads': rows,
+                    'to_buy': [row['dmc'] for row in rows if not row['owned']]})
+
+@app.route('/pattern/<int:pattern_id>/tiles.json')
+@login_required
+def pattern_tiles_info(pattern_id):
+    pattern = pattern_query(Pattern.pattern_data).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    layout, _, _ = pattern_layout(pattern.pattern_data)
+    H, W = layout['height'], layout['width']
+    levels = []
+    for z, cell_px in enumerate(TILE_CELL_PX):
+        levels.append({
+            'z': z,
+            'cell_px': cell_px,
+            'width': W*cell_px,
+            'height': H*cell_px,
+            'cols': -(-W*cell_px // TILE_SIZE),
+            'rows': -(-H*cell_px // TILE_SIZE)
+        })
+    
+    return jsonify({'tile_size': TILE_SIZE, 'version': pattern_version(pattern), 'zoom_levels': levels})
+
+@app.route('/pattern/<int:pattern_id>/tiles/<int:z>/<int:x>/<int:y>.png')
+@login_required
+def pattern_tile(pattern_id, z, x, y):
+    style = request.args.get('style', 'color')
+    if style not in ('color', 'symbol') or z >= len(TILE_CELL_PX):
+        return jsonify({'error': 'Unknown tile'}), 404
+    
+    pattern = pattern_query(Pattern.pattern_data).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    version = pattern_version(pattern)
+    name = f"{style}_{z}_{x}_{y}"
+    data = tile_cache.get(pattern.id, version, name)
+    if data is None:
+        idx_map, palette_idx, symbol_map = windowed_pattern(pattern.pattern_data)
+        data = render_tile(idx_map, palette_idx, symbol_map, style, z, x, y)
+        if data is None:
+            return jsonify({'error': 'Tile out of range'}), 404
+        tile_cache.put(pattern.id, version, name, data)
+    
+    response = send_file(io.BytesIO(data), mimetype='image/png', etag=f"{version}-{name}")
+    response.headers['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+def progress_summary(done, version, idx_map, palette_idx):
+    """Progress payload with per-color completion counts"""
+    completed, total = color_counts(done, idx_map, len(palette_idx))
+    return {
+        'success': True,
+        'version': version,
+        'done': int(completed.sum()),
+        'total': int(idx_map.size),
+        'colors': [{'dmc': palette_idx[i][0], 'done': int(completed[i]), 'total': int(total[i])}
+                   for i in range(len(palette_idx))]
+    }
+
+def write_progress(batch):
+    """Write coalesced progress of several patterns in one transaction
+
+    Entries with operations only replace the progress they were applied to.
+    When another worker process wrote in between, the operations are
+    replayed on its progress instead.
+    """
+    with app.app_context():
+        for pattern_id, entry in batch.items():
+            done, version = entry['done'], entry['version']
+            query = Pattern.query.filter(Pattern.id == pattern_id)
+            if entry['ops'] is not None:
+                query = query.filter(Pattern.progress_data.is_(None) if entry['base'] is None
+                                     else Pattern.progress_data == entry['base'])
+            updated = query.update({Pattern.progress_data: json.dumps(encode_progress(done, version))},
+                                   synchronize_session=False)
+            if updated != 1:
+                # The failed update started the write transaction, so nobody can write in between
+                pattern = db.session.get(Pattern, pattern_id,
+                                         options=[load_only(Pattern.pattern_data, Pattern.progress_data)])
+                if pattern is None:
+                    continue
+                idx_map, _, _ = decoded_pattern(pattern.pattern_data)
+                done, stored_version = decode_progress(pattern.progress_data, idx_map.shape[1], idx_map.shape[0])
+                apply_ops(done, entry['ops'], idx_map)
+                Pattern.query.filter(Pattern.id == pattern_id).update(
+                    {Pattern.progress_data: json.dumps(encode_progress(done, max(version, stored_version + 1)))},
+                    synchronize_session=False)
+            PatternSummary.query.filter_by(pattern_id=pattern_id).update({PatternSummary.stitches_done: int(done.sum())})
+        db.session.commit()
+
+progress_writes = WriteBehind(write_progress,
+                              app.config['PROGRESS_FLUSH_DELAY'],
+                              app.config['PROGRESS_MAX_PENDING'],
+                              lambda e: app.logger.error("Progress flush failed: %s", e))
+
+def stored_progress(pattern_id, W, H):
+    """(raw, done, version) of the progress currently in the database"""
+    raw = db.session.query(Pattern.progress_data).filter(Pattern.id == pattern_id).scalar()
+    return (raw,) + decode_progress(raw, W, H)
+
+def current_progress(pattern, W, H):
+    """(done, version) of a pattern, including progress not written to the database yet"""
+    pending = progress_writes.get(pattern.id)
+    if pending is not None:
+        return pending['done'].copy(), pending['version']
+    return decode_progress(pattern.progress_data, W, H)
+
+@app.route('/pattern/<int:pattern_id>/progress', methods=['GET', 'PATCH'])
+@login_required
+def pattern_progress(pattern_id):
+    pattern = pattern_query(Pattern.pattern_data, Pattern.progress_data).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    idx_map, palette_idx, _ = decoded_pattern(pattern.pattern_data)
+    H, W = idx_map.shape
+    if request.method == 'GET':
+        done, version = current_progress(pattern, W, H)
+        return jsonify({**progress_summary(done, version, idx_map, palette_idx),
+                        'progress': encode_progress(done, version)})
+    
+    data = request.get_json()
+    ops = data.get('ops', [])
+    
+    def patch(pending):
+        # Builds on progress still waiting to be written; otherwise on what a
+        # flush may have written since the pattern was loaded
+        if pending is None:
+            base, done, version = stored_progress(pattern.id, W, H)
+        else:
+            done, version = pending['done'].copy(), pending['version']
+        if data.get('version') is not None and int(data['version']) != version:
+            raise ProgressConflict(version)
+        apply_ops(done, ops, idx_map)
+        if pending is None:
+            return {'done': done, 'version': version + 1, 'base': base, 'ops': list(ops)}
+        queued = None if pending['ops'] is None else pending['ops'] + list(ops)
+        return {'done': done, 'version': version + 1, 'base': pending['base'], 'ops': queued}
+    
+    try:
+        entry = progress_writes.update(pattern.id, patch)
+    except ProgressConflict as e:
+        return jsonify({'error': str(e), 'version': e.version}), 409
+    except (ValueError, TypeError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(progress_summary(entry['done'], entry['version'], idx_map, palette_idx))
+
+def edited_pattern_data(pattern, ops):
+    """New pattern data and colors_used after applying edit operations to a saved pattern"""
+    data = load_pattern_data(pattern.pattern_data)
+    layout = data['pattern']
+    grid = pattern_grid(layout)
+    edit = PatternEdit(grid, layout['palette'], pattern_usage(pattern.pattern_data), SYMBOLS,
+                       get_palette('dmc').color).apply(ops)
+    
+    # Untouched grids keep their blob; otherwise only the changed bands are recompressed
+    if 'grid_ref' in layout:
+        grid_ref = blob_store.put_grid(edit.grid, layout['grid_ref'], edit.changed_rows)
+    else:
+        grid_ref = blob_store.put_grid(edit.grid)
+    stored = {k: v for k, v in layout.items() if k != 'grid'}
+    stored.update(palette=edit.palette, dtype=edit.grid.dtype.name, grid_ref=grid_ref,
+                  usage=edit.usage())
+    colors_used = colors_in_order(json.loads(pattern.colors_used), edit.palette)
+    new_data = {k: v for k, v in data.items() if k != 'symbol_map'}
+    new_data.update(pattern=stored, colors_used=colors_used)
+    return new_data, colors_used
+
+def replace_pattern_data(pattern, pattern_data, colors_used):
+    """Swap in new pattern data if nobody changed it since it was read; refreshes summary and tiles"""
+    updated = (Pattern.query.filter(Pattern.id == pattern.id, Pattern.pattern_data == pattern.pattern_data)
+               .update({Pattern.pattern_data: pattern_data, Pattern.colors_used: colors_used},
+                       synchronize_session=False))
+    if updated != 1:
+        db.session.rollback()
+        return False
+    
+    idx_map, palette_idx, _ = decoded_pattern(pattern_data)
+    PatternSummary.query.filter_by(pattern_id=pattern.id).update({
+        PatternSummary.color_count: len(palette_idx),
+        PatternSummary.thumbnail: pattern_thumbnail(idx_map, palette_idx)
+    })
+    tile_cache.invalidate(pattern.id)
+    return True
+
+def edit_summary(pattern_id, pattern_data):
+    """Palette, usage counts and version after an edit or undo"""
+    layout, _, _ = pattern_layout(pattern_data)
+    counts = pattern_usage(pattern_data)['counts']
+    revisions = PatternRevision.query.filter_by(pattern_id=pattern_id).count()
+    return {
+        'success': True,
+        'version': data_version(pattern_data),
+        'revisions': revisions,
+        'palette': [{'dmc': dmc, 'name': name, 'rgb': rgb, 'symbol': symbol, 'count': int(count)}
+                    for (dmc, name, rgb, symbol), count in zip(layout['palette'], counts)]
+    }
+
+@app.route('/pattern/<int:pattern_id>/edit', methods=['POST'])
+@login_required
+def edit_pattern(pattern_id):
+    pattern = pattern_query(Pattern.pattern_data, Pattern.colors_used).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json() or {}
+    if data.get('version') is not None and data['version'] != pattern_version(pattern):
+        return jsonify({'error': 'Pattern changed since it was loaded', 'version': pattern_version(pattern)}), 409
+    try:
+        new_data, colors_used = edited_pattern_data(pattern, data.get('ops', []))
+    except (EditError, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    raw = json.dumps(new_data)
+    previous = PatternRevision(pattern_id=pattern.id, pattern_data=pattern.pattern_data,
+                               colors_used=pattern.colors_used)
+    if not replace_pattern_data(pattern, raw, json.dumps(colors_used)):
+        return jsonify({'error': 'Pattern changed since it was loaded'}), 409
+    db.session.add(previous)
+    
+    # Keep only the newest PATTERN_MAX_REVISIONS undo steps
+    stale = (PatternRevision.query.with_entities(PatternRevision.id).filter_by(pattern_id=pattern.id)
+             .order_by(PatternRevision.id.desc()).offset(PATTERN_MAX_REVISIONS).all())
+    if stale:
+        PatternRevision.query.filter(PatternRevision.id.in_([r.id for r in stale])).delete(synchronize_session=False)
+    db.session.commit()
+    return jsonify(edit_summary(pattern.id, raw))
+
+@app.route('/pattern/<int:pattern_id>/undo', methods=['POST'])
+@login_required
+def undo_pattern_edit(pattern_id):
+    pattern = pattern_query(Pattern.pattern_data, Pattern.colors_used).get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    revision = (PatternRevision.query.filter_by(pattern_id=pattern.id)
+                .order_by(PatternRevision.id.desc()).first())
+    if revision is None:
+        return jsonify({'error': 'Nothing to undo'}), 409
+    if not replace_pattern_data(pattern, revision.pattern_data, revision.colors_used):
+        return jsonify({'error': 'Pattern changed since it was loaded'}), 409
+    raw = revision.pattern_data
+    db.session.delete(revision)
+    db.session.commit()
+    return jsonify(edit_summary(pattern.id, raw))
+
+@app.route('/pattern/<int:pattern_id>/revisions')
+@login_required
+def pattern_revisions(pattern_id):
+    pattern = pattern_query().get_or_404(pattern_id)
+    if pattern.user_id != current_user.id:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    revisions = (PatternRevision.query.options(load_only(PatternRevision.id, PatternRevision.created_at))
+                 .filter_by(pattern_id=pattern.id).order_by(PatternRevision.id.desc()).all())
+    return jsonify({'revisions': [{'id': r.id, 'created_at': r.created_at.isoformat()} for r in revisions]})
+
 @app.route('/update_progress', methods=['POST'])
 @login_required
 def update_progress():
@@ -472,14 +1813,21 @@ def update_progress():
     pattern_id = data['pattern_id']
     progress_data = data['progress_data']
     
-    pattern = Pattern.query.get_or_404(pattern_id)
+    pattern = pattern_query(Pattern.pattern_data).get_or_404(pattern_id)
     if pattern.user_id != current_user.id:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    pattern.progress_data = json.dumps(progress_data)
-    db.session.commit()
+    # Full replacement; accepts a bitset or an old-style list of stitches
+    idx_map, _, _ = decoded_pattern(pattern.pattern_data)
+    H, W = idx_map.shape
+    done, _ = decode_progress(progress_data, W, H)
+    def replace(pending):
+        version = pending['version'] if pending else stored_progress(pattern.id, W, H)[2]
+        return {'done': done, 'version': version + 1, 'base': None, 'ops': None}  # written whatever is stored
+    
+    entry = progress_writes.update(pattern.id, replace)
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'version': entry['version']})
 
 @app.route('/create_folder', methods=['POST'])
 @login_required
@@ -544,4 +1892,14 @@ def get_dmc_colors():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        # create_all skips indexes added to tables that already exist
+        for index in Pattern.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+        move_grids_to_blob_store()
+        index_pattern_usage()
+    upload_store.adopt_files()
+    upload_store.start_sweeper(app.config['UPLOAD_SWEEP_INTERVAL'],
+                               lambda e: app.logger.error("Upload sweep failed: %s", e))
+    blob_store.start_sweeper(app.config['PATTERN_BLOB_SWEEP_INTERVAL'],
+                             lambda e: app.logger.error("Pattern blob sweep failed: %s", e))
     app.run(debug=True, host='0.0.0.0', port=5001)
@@ -0,0 +1,235 @@
+# Pipeline Benchmarks
+# Times each stage of the conversion and rendering pipeline on deterministic
+# synthetic images and writes the results as JSON. A stored baseline can be
+# compared against, failing when any stage slows down beyond a threshold.
+#
+#   cd backend
+#   python -m benchmarks.pipeline_bench --quick --output bench.json
+#   python -m benchmarks.pipeline_bench --baseline bench.json --threshold 0.25
+#
+# Peak memory is the Python/NumPy heap high-water mark from tracemalloc, taken
+# in a separate untimed run; Pillow's internal image buffers are not included.
+
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import PIL
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as pipeline
+from utils import color_lut
+from utils.color_metrics import METRICS
+from utils.ingest import load_for_stitches
+
+IMAGE_KINDS = ('gradient', 'photo', 'flat')
+SIZES = (50, 100, 250, 500, 1000)
+MAX_COLORS = (10, 30, 60)
+CELL_PX = (4, 14, 28)
+QUICK_SIZES = (50, 100)
+QUICK_MAX_COLORS = (30,)
+QUICK_CELL_PX = (4,)
+SOURCE_SCALE = 4  # source image pixels per stitch along each axis
+MAX_SOURCE_PX = 2000
+MAX_RENDER_PIXELS = 40 * 1000 * 1000  # larger charts are skipped
+SEED = 1234
+MIN_REGRESSION_SECONDS = 0.002  # ignore changes smaller than timer noise
+
+
+def synthetic_image(kind, width, height, seed=SEED):
+    """Deterministic test image as (encoded bytes, format)"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float64)
+    u, v = x / max(width - 1, 1), y / max(height - 1, 1)
+
+    if kind == 'gradient':
+        rgb = np.stack([255 * u, 255 * v, 255 * (1 - u) * v + 64 * u], axis=-1)
+        fmt = 'PNG'
+    elif kind == 'photo':
+        # Smooth low-frequency structure plus fine sensor-like noise
+        coarse = rng.uniform(0, 255, (9, 12, 3)).astype(np.uint8)
+        base = np.asarray(Image.fromarray(coarse).resize((width, height), Image.Resampling.BICUBIC), dtype=np.float64)
+        shade = 40 * np.sin(6 * u + 3 * v)[..., None]
+        rgb = base + shade + rng.normal(0, 12, (height, width, 3))
+        fmt = 'JPEG'
+    elif kind == 'flat':
+        # Poster-style art: a handful of solid colors in blocks and discs
+        colors = rng.integers(0, 256, (8, 3))
+        labels = ((x // max(width // 6, 1)) + 2 * (y // max(height // 5, 1))).astype(int) % 4
+        for k in range(4, 8):
+            cx, cy, r = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(0.05, 0.2) * width
+            labels[(x - cx) ** 2 + (y - cy) ** 2 < r * r] = k
+        rgb = colors[labels]
+        fmt = 'PNG'
+    else:
+        raise ValueError(f"Unknown image kind '{kind}'")
+
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8)).save(buf, format=fmt)
+    return buf.getvalue(), fmt
+
+
+def measure(fn, repeat, memory=True):
+    """(result, best wall seconds, peak traced bytes) of fn()"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def output_size(value):
+    """Bytes of a stage's output"""
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, Image.Image):
+        return value.width * value.height * len(value.getbands())
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict) and 'pattern' in value:
+        return len(json.dumps(value['pattern']))
+    return None
+
+
+def run_benchmarks(kinds, sizes, max_colors, cell_sizes, metrics, repeat, memory):
+    """Run the sweep and return a list of result records"""
+    pipeline.app.config['COLOR_LUT_FOLDER'] = None
+    pipeline.result_cache.folder = None
+    palette_rgb, palette_idx = pipeline.dmc_palette()
+    records = []
+
+    def record(case, stage, fn):
+        value, seconds, peak = measure(fn, repeat, memory)
+        records.append({
+            'case': case,
+            'stage': stage,
+            'seconds': round(seconds, 6),
+            'peak_bytes': peak,
+            'output_bytes': output_size(value)
+        })
+        print(f"{case:<32} {stage:<16} {seconds * 1000:10.2f} ms"
+              + (f" {peak / 1e6:10.2f} MB" if peak is not None else ""))
+        return value
+
+    for metric in metrics:
+        def build_lut():
+            color_lut._LUT_CACHE.clear()
+            return color_lut.get_color_lut(palette_rgb, metric=metric)[0]
+        record(f"palette/{metric}", 'lut_build', build_lut)
+
+    for kind in kinds:
+        for size in sizes:
+            src_px = min(size * SOURCE_SCALE, MAX_SOURCE_PX)
+            source, fmt = synthetic_image(kind, src_px, src_px)
+            for metric in metrics:
+                case = f"{kind}/{size}x{size}/{metric}"
+                img = record(case, 'decode_resize', lambda: load_for_stitches(io.BytesIO(source), size, size)[0])
+                grid = np.asarray(img, dtype=np.uint8)
+                idx_map = record(case, 'match', lambda: pipeline.nearest_color_indices(grid, palette_rgb, metric))
+
+                results = {}
+                for cap in max_colors:
+                    cap_case = f"{case}/c{cap}"
+                    reduced = record(cap_case, 'reduce', lambda: pipeline.reduce_to_top_colors(
+                        idx_map, cap, palette_rgb, metric))
+                    result = record(cap_case, 'build', lambda: pipeline.finish_pattern(
+                        reduced, palette_rgb, palette_idx, 14, 0, metric, 'frequency', None))
+                    record(cap_case, 'serialize', lambda: json.dumps(result))
+                    results[cap] = (reduced, result)
+
+                # Charts are rendered for the middle color cap only
+                reduced, result = results[max_colors[len(max_colors) // 2]]
+                for cell_px in cell_sizes:
+                    if size * size * cell_px * cell_px > MAX_RENDER_PIXELS:
+                        continue
+                    render_case = f"{case}/px{cell_px}"
+                    record(render_case, 'render_colored', lambda: pipeline.render_colored_chart(
+                        reduced, palette_idx, cell_px))
+                    record(render_case, 'render_symbol', lambda: pipeline.render_symbol_chart(
+                        reduced, palette_idx, cell_px, result['symbol_map']))
+    return records
+
+
+def compare(records, baseline, threshold):
+    """Stages that got slower than baseline by more than threshold"""
+    previous = {(r['case'], r['stage']): r for r in baseline['results']}
+    regressions = []
+    for r in records:
+        old = previous.get((r['case'], r['stage']))
+        if old is None or not old['seconds']:
+            continue
+        if r['seconds'] > old['seconds'] * (1 + threshold) and r['seconds'] - old['seconds'] > MIN_REGRESSION_SECONDS:
+            regressions.append({**r, 'baseline_seconds': old['seconds'], 'ratio': round(r['seconds'] / old['seconds'], 3)})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pattern conversion and rendering pipeline")
+    parser.add_argument('--quick', action='store_true', help="small sweep for a fast check")
+    parser.add_argument('--images', nargs='+', choices=IMAGE_KINDS, default=list(IMAGE_KINDS))
+    parser.add_argument('--sizes', nargs='+', type=int, help="square canvas sizes in stitches")
+    parser.add_argument('--max-colors', nargs='+', type=int, help="color caps")
+    parser.add_argument('--cell-px', nargs='+', type=int, help="chart cell sizes in pixels")
+    parser.add_argument('--metrics', nargs='+', choices=METRICS, default=['rgb'])
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage; the best is kept")
+    parser.add_argument('--no-memory', action='store_true', help="skip the traced memory run")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--baseline', help="results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown ratio, e.g. 0.25 = 25%%")
+    args = parser.parse_args(argv)
+
+    sizes = args.sizes or (QUICK_SIZES if args.quick else SIZES)
+    max_colors = args.max_colors or (QUICK_MAX_COLORS if args.quick else MAX_COLORS)
+    cell_sizes = args.cell_px or (QUICK_CELL_PX if args.quick else CELL_PX)
+
+    records = run_benchmarks(args.images, sizes, max_colors, cell_sizes, args.metrics,
+                             args.repeat, not args.no_memory)
+    report = {
+        'meta': {
+            'created_at': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'algorithm_version': pipeline.PATTERN_ALGORITHM_VERSION,
+            'repeat': args.repeat
+        },
+        'results': records
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(records, json.load(f), args.threshold)
+        for r in regressions:
+            print(f"REGRESSION {r['case']} {r['stage']}: {r['baseline_seconds'] * 1000:.2f} ms -> "
+                  f"{r['seconds'] * 1000:.2f} ms (x{r['ratio']})")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
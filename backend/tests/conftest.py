@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read by app.config.from_prefixed_env() when the app is imported
+_root = tempfile.mkdtemp(prefix='needlepoint-tests-')
+os.environ.update({
+    'FLASK_SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    'FLASK_UPLOAD_FOLDER': os.path.join(_root, 'uploads'),
+    'FLASK_PATTERN_BLOB_FOLDER': os.path.join(_root, 'pattern_blobs'),
+    'FLASK_COLOR_LUT_FOLDER': 'null',
+    'FLASK_TILE_CACHE_FOLDER': 'null',
+    'FLASK_RESULT_CACHE_FOLDER': 'null',
+    'FLASK_PROGRESS_FLUSH_DELAY': '0',
+})
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    import app
+    with app.app.app_context():
+        app.db.create_all()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    """Test client logged in as a fresh user"""
+    client = app_module.app.test_client()
+    email = f"{uuid.uuid4().hex}@example.com"
+    client.post('/register', json={'email': email, 'username': email, 'password': 'password'})
+    client.post('/login', json={'email': email, 'password': 'password'})
+    return client
+
+
+@pytest.fixture
+def save_pattern(app_module, client):
+    """Save an index grid of DMC palette rows as a pattern; returns its id"""
+    from utils.pattern_format import encode_pattern
+
+    def save(idx_map):
+        _, palette_idx = app_module.dmc_palette()
+        used = sorted(set(idx_map.reshape(-1).tolist()))
+        H, W = idx_map.shape
+        pattern = encode_pattern(idx_map, palette_idx, app_module.build_symbol_map(used))
+        colors_used = [palette_idx[i][0] for i in used]
+        pattern_data = {'pattern': pattern, 'width': W, 'height': H, 'mesh_count': 14, 'colors_used': colors_used}
+        response = client.post('/save_pattern', json={
+            'name': 'test', 'original_image': 'test.png', 'pattern_data': pattern_data,
+            'canvas_size': f"{W}x{H}", 'mesh_count': 14, 'colors_used': colors_used})
+        return response.get_json()['pattern_id']
+    return save
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.color_lut import lookup_nearest
+from utils.color_metrics import delta_e_cie76, srgb_to_lab
+from utils.palette import get_palette
+
+palette_rgb = get_palette('dmc').rgb
+
+
+def random_pixels(n, seed):
+    return np.random.default_rng(seed).integers(0, 256, (n, 3), dtype=np.uint8)
+
+
+def test_rgb_lookup_matches_brute_force():
+    pixels = random_pixels(20000, 0)
+    idx = lookup_nearest(pixels, palette_rgb, 'rgb')
+    diff = pixels[:, None, :].astype(np.int64) - palette_rgb[None, :, :].astype(np.int64)
+    dist = (diff * diff).sum(axis=2)
+    # Ties may resolve to either color, so compare distances rather than indices
+    assert np.array_equal(dist[np.arange(len(pixels)), idx], dist.min(axis=1))
+
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_cie76_lookup_matches_brute_force(seed):
+    pixels = random_pixels(5000, seed)
+    idx = lookup_nearest(pixels, palette_rgb, 'cie76')
+    dist = delta_e_cie76(srgb_to_lab(pixels)[:, None, :], srgb_to_lab(palette_rgb)[None, :, :])
+    np.testing.assert_allclose(dist[np.arange(len(pixels)), idx], dist.min(axis=1), rtol=0, atol=1e-9)
@@ -0,0 +1,28 @@
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.parallel import BandPool
+
+pool = BandPool(workers=4, min_cells=1)
+
+
+def band_sums(n):
+    values = np.arange(n * n).reshape(n, n)
+    return pool.map(lambda band: int(values[band[0]:band[1]].sum()), pool.split(n, n))
+
+
+@pytest.mark.skipif(not hasattr(os, 'register_at_fork'), reason="needs fork")
+def test_pool_used_before_fork_works_in_child():
+    expected = band_sums(64)
+    assert pool._executor is not None  # the parent's threads exist now
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('fork')) as jobs:
+        # Without the reset the child waits forever on the parent's executor
+        assert jobs.submit(band_sums, 64).result(timeout=30) == expected
+    assert band_sums(64) == expected
@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+
+
+def stored(app_module, pattern_id):
+    """(raw pattern_data, decoded index grid, usage index) of a saved pattern"""
+    with app_module.app.app_context():
+        pattern = app_module.db.session.get(app_module.Pattern, pattern_id)
+        idx_map, _, _ = app_module.decoded_pattern(pattern.pattern_data)
+        return pattern.pattern_data, idx_map, app_module.pattern_usage(pattern.pattern_data)
+
+
+def test_edit_then_undo_restores_pattern_data(app_module, client, save_pattern):
+    rng = np.random.default_rng(0)
+    original = rng.integers(0, 6, (40, 50))
+    pattern_id = save_pattern(original)
+    before, _, _ = stored(app_module, pattern_id)
+    _, palette_idx = app_module.dmc_palette()
+    dmc = [palette_idx[i][0] for i in range(8)]
+
+    ops = [
+        {'op': 'swap', 'from': dmc[0], 'to': dmc[7]},
+        {'op': 'merge', 'from': [dmc[1]], 'into': dmc[2]},
+        {'op': 'repaint', 'dmc': dmc[6], 'rect': [5, 5, 20, 12]},
+        {'op': 'repaint', 'dmc': dmc[3], 'cells': [0, 1, 2, 51], 'where': dmc[2]},
+    ]
+    response = client.post(f'/pattern/{pattern_id}/edit', json={'ops': ops})
+    assert response.status_code == 200
+
+    edited, grid, usage = stored(app_module, pattern_id)
+    assert edited != before
+    # Usage kept up to date incrementally matches a full rescan
+    assert usage == app_module.usage_index(grid, len(json.loads(edited)['pattern']['palette']))
+
+    assert client.post(f'/pattern/{pattern_id}/undo').status_code == 200
+    after, grid, _ = stored(app_module, pattern_id)
+    assert after == before
+    assert np.array_equal(grid, original)
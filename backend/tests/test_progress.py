@@ -0,0 +1,29 @@
+import numpy as np
+
+
+def test_patch_on_stale_version_is_rejected(client, save_pattern):
+    pattern_id = save_pattern(np.arange(48).reshape(6, 8) % 5)
+    url = f'/pattern/{pattern_id}/progress'
+    version = client.get(url).get_json()['version']
+
+    first = client.patch(url, json={'version': version, 'ops': [{'op': 'set', 'rows': [0, 2]}]})
+    assert first.status_code == 200
+    assert first.get_json()['version'] == version + 1
+
+    # A second client still holding the old version must reload first
+    stale = client.patch(url, json={'version': version, 'ops': [{'op': 'clear', 'rows': [0, 6]}]})
+    assert stale.status_code == 409
+    assert stale.get_json()['version'] == version + 1
+
+    # The rejected patch changed nothing
+    progress = client.get(url).get_json()
+    assert progress['version'] == version + 1
+    assert client.patch(url, json={'version': version + 1, 'ops': []}).status_code == 200
+
+
+def test_malformed_ops_are_rejected(client, save_pattern):
+    pattern_id = save_pattern(np.zeros((3, 3), dtype=np.int64))
+    url = f'/pattern/{pattern_id}/progress'
+    assert client.patch(url, json={'ops': {'op': 'set'}}).status_code == 400
+    assert client.patch(url, json={'ops': ['set']}).status_code == 400
+    assert client.patch(url, json={'ops': [{'op': 'set'}]}).status_code == 400
@@ -0,0 +1,218 @@
+# Pattern Blob Store
+# Stitch grids of saved patterns live outside the database as content-
+# addressed files (folder/ab/abcdef..., named by the SHA-256 of the bytes),
+# so identical grids are stored once and a pattern row only keeps a
+# reference. A grid blob is split into row bands that are zlib-compressed
+# separately:
+#   header   <4sIIBBHI  magic, height, width, item size, 0, band rows, bands
+#   offsets  (bands + 1) little-endian uint64 byte offsets of each band
+#   bands    zlib(row-major little-endian index rows)
+# Blobs are memory-mapped, and a slice of a GridBlob only inflates the
+# bands it touches, so rendering a tile of a large pattern reads a few
+# bands instead of the whole grid. A sweep deletes blobs that no saved
+# pattern or revision references once they are older than a minimum age,
+# so a grid written just before its pattern row is committed survives.
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+
+GRID_MAGIC = b'NPGB'
+GRID_HEADER = struct.Struct('<4sIIBBHI')
+GRID_BAND_ROWS = 32
+GRID_DTYPES = {1: np.dtype('<u1'), 2: np.dtype('<u2')}
+
+
+def pack_grid(grid, band_rows=GRID_BAND_ROWS, base=None, changed_rows=None):
+    """Serialize an (H, W) uint8/uint16 index grid as a banded blob
+
+    With a base GridBlob of the same layout and the (y0, y1) span of rows
+    that differ from it, the other bands are copied still compressed.
+    """
+    dtype = np.dtype(grid.dtype).newbyteorder('<')
+    if dtype.itemsize not in GRID_DTYPES:
+        raise ValueError(f"Unsupported grid dtype {grid.dtype}")
+    H, W = grid.shape
+    reuse = (base is not None and changed_rows is not None and base.shape == (H, W)
+             and base.dtype == dtype and base.band_rows == band_rows)
+    bands = []
+    for i, y in enumerate(range(0, H, band_rows)):
+        if reuse and (y + band_rows <= changed_rows[0] or y >= changed_rows[1]):
+            bands.append(base.compressed_band(i))
+        else:
+            bands.append(zlib.compress(np.ascontiguousarray(grid[y:y + band_rows], dtype=dtype).tobytes(), 6))
+    offsets = np.zeros(len(bands) + 1, dtype='<u8')
+    offsets[0] = GRID_HEADER.size + offsets.nbytes
+    offsets[1:] = offsets[0] + np.cumsum([len(b) for b in bands])
+    header = GRID_HEADER.pack(GRID_MAGIC, H, W, dtype.itemsize, 0, band_rows, len(bands))
+    return b''.join([header, offsets.tobytes()] + bands)
+
+
+class GridBlob:
+    """Read-only view of a banded grid blob; slicing inflates only the bands it needs"""
+
+    def __init__(self, buffer):
+        magic, H, W, itemsize, _, band_rows, n_bands = GRID_HEADER.unpack_from(buffer, 0)
+        if magic != GRID_MAGIC or itemsize not in GRID_DTYPES:
+            raise ValueError("Not a grid blob")
+        self.buffer = buffer
+        self.shape = (H, W)
+        self.dtype = GRID_DTYPES[itemsize]
+        self.band_rows = band_rows
+        self.offsets = np.frombuffer(buffer, dtype='<u8', count=n_bands + 1, offset=GRID_HEADER.size)
+
+    def compressed_band(self, i):
+        """Stored bytes of band i"""
+        return self.buffer[int(self.offsets[i]):int(self.offsets[i + 1])]
+
+    def band(self, i):
+        """Rows of band i as an array"""
+        start, stop = int(self.offsets[i]), int(self.offsets[i + 1])
+        raw = zlib.decompress(self.buffer[start:stop])
+        return np.frombuffer(raw, dtype=self.dtype).reshape(-1, self.shape[1])
+
+    def rows(self, y0, y1):
+        """Rows [y0, y1) as an array, inflating only the overlapping bands"""
+        y0, y1 = max(y0, 0), min(y1, self.shape[0])
+        if y1 <= y0:
+            return np.zeros((0, self.shape[1]), dtype=self.dtype)
+        first, last = y0 // self.band_rows, (y1 - 1) // self.band_rows
+        parts = [self.band(i) for i in range(first, last + 1)]
+        block = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        return block[y0 - first * self.band_rows:y1 - first * self.band_rows]
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        rows = key[0]
+        if isinstance(rows, (int, np.integer)):
+            y = int(rows) + (self.shape[0] if rows < 0 else 0)
+            return self.rows(y, y + 1)[(0,) + key[1:]]
+        if not isinstance(rows, slice) or rows.step not in (None, 1):
+            return np.asarray(self)[key]
+        y0, y1, _ = rows.indices(self.shape[0])
+        return self.rows(y0, y1)[(slice(None),) + key[1:]]
+
+    def __array__(self, dtype=None, copy=None):
+        grid = self.rows(0, self.shape[0])
+        return grid if dtype is None else grid.astype(dtype)
+
+
+class BlobStore:
+    """Content-addressed files under a folder"""
+
+    def __init__(self, folder, open_blobs=32, min_age=15 * 60, referenced=None):
+        self.folder = folder
+        self.open_blobs = open_blobs
+        self.min_age = min_age
+        self.referenced = referenced or (lambda: set())
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def _path(self, key):
+        if len(key) != 64 or not all(c in '0123456789abcdef' for c in key):
+            raise ValueError(f"Invalid blob key '{key}'")
+        return os.path.join(self.folder, key[:2], key)
+
+    def put(self, data):
+        """Store bytes and return their key; existing content is not rewritten"""
+        key = hashlib.sha256(data).hexdigest()
+        path = self._path(key)
+        try:
+            # Storing existing content again counts as a fresh write for the sweep
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def put_grid(self, grid, base_key=None, changed_rows=None):
+        """Store an index grid as a banded blob; returns its key
+
+        When the grid is an edit of the blob base_key that only changed rows
+        [y0, y1), the untouched bands are reused without recompressing.
+        """
+        if base_key is not None and changed_rows is None:
+            return base_key
+        base = self.grid(base_key) if base_key is not None else None
+        return self.put(pack_grid(grid, base=base, changed_rows=changed_rows))
+
+    def grid(self, key):
+        """Memory-mapped GridBlob for a key; recently used blobs stay mapped"""
+        with self._lock:
+            blob = self._grids.get(key)
+            if blob is not None:
+                self._grids.move_to_end(key)
+                return blob
+        with open(self._path(key), 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        blob = GridBlob(buffer)
+        with self._lock:
+            self._grids[key] = blob
+            while len(self._grids) > self.open_blobs:
+                self._grids.popitem(last=False)
+        return blob
+
+    def _old_keys(self, cutoff):
+        """Keys of blobs last written before cutoff"""
+        keys = []
+        if not os.path.isdir(self.folder):
+            return keys
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir() or len(shard.name) != 2:
+                continue
+            for entry in os.scandir(shard.path):
+                if len(entry.name) == 64 and entry.is_file() and entry.stat().st_mtime < cutoff:
+                    keys.append(entry.name)
+        return keys
+
+    def sweep(self):
+        """Delete blobs older than min_age that referenced() does not return; returns how many"""
+        cutoff = time.time() - self.min_age
+        candidates = self._old_keys(cutoff)
+        if not candidates:
+            return 0
+        used = self.referenced()
+        removed = 0
+        for key in candidates:
+            if key in used:
+                continue
+            path = self._path(key)
+            try:
+                # Skip blobs written again since they were listed
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+                os.remove(path)
+            except OSError:
+                continue
+            with self._lock:
+                self._grids.pop(key, None)
+            removed += 1
+        return removed
+
+    def start_sweeper(self, interval, on_error=None):
+        """Run sweep() every interval seconds in a daemon thread"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(e)
+
+        self._sweeper = threading.Thread(target=run, name='blob-sweeper', daemon=True)
+        self._sweeper.start()
@@ -0,0 +1,81 @@
+# Chart Rasterizer
+# Builds chart pixels directly as arrays instead of drawing one rectangle per
+# stitch. Any pixel window of the full chart can be rendered on its own, and
+# the output matches what ImageDraw produces for the same chart.
+
+from functools import lru_cache
+import numpy as np
+
+GRID_COLOR = (0, 0, 0)
+
+
+def grid_line_width(k, heavy_every, medium_every):
+    """Width of the k-th grid line"""
+    if k % heavy_every == 0:
+        return 3
+    if k % medium_every == 0:
+        return 2
+    return 1
+
+
+@lru_cache(maxsize=64)
+def grid_line_mask(n_cells, cell_px, heavy_every, medium_every):
+    """Boolean mask over chart pixel coordinates covered by grid lines along one axis"""
+    size = n_cells * cell_px
+    mask = np.zeros(size, dtype=bool)
+    for k in range(n_cells + 1):
+        # ImageDraw centres odd widths on the line and extends even widths forward
+        width = grid_line_width(k, heavy_every, medium_every)
+        start = k * cell_px - (width - 1) // 2
+        mask[max(start, 0):max(start + width, 0)] = True
+    mask.setflags(write=False)
+    return mask
+
+
+def palette_colors(palette_idx):
+    """Dense RGB lookup array for a {palette index: (dmc, name, rgb)} mapping"""
+    colors = np.zeros((max(palette_idx) + 1, 3), dtype=np.uint8)
+    for idx, (_, _, rgb) in palette_idx.items():
+        colors[idx] = rgb
+    return colors
+
+
+def stitch_window(x0, y0, w, h, cell_px):
+    """Stitch-index bounds (sx0, sy0, sx1, sy1) covering a pixel window"""
+    return x0 // cell_px, y0 // cell_px, -(-(x0 + w) // cell_px), -(-(y0 + h) // cell_px)
+
+
+def rasterize_colors(idx_map, colors, cell_px, x0, y0, w, h, heavy_every, medium_every, grid=True):
+    """Render the colored chart pixels for the window [x0, x0+w) x [y0, y0+h)"""
+    H, W = idx_map.shape
+    sx0, sy0, sx1, sy1 = stitch_window(x0, y0, w, h, cell_px)
+    ox = x0 - sx0 * cell_px
+    oy = y0 - sy0 * cell_px
+
+    # Widen each stitch row to pixels and draw vertical lines there, so the
+    # row repeat below carries them down every pixel row for free
+    rows = np.repeat(colors[idx_map[sy0:sy1, sx0:sx1]], cell_px, axis=1)[:, ox:ox + w]
+    if grid:
+        cols = grid_line_mask(W, cell_px, heavy_every, medium_every)[x0:x0 + w]
+        rows[:, cols] = GRID_COLOR
+    pixels = np.repeat(rows, cell_px, axis=0)[oy:oy + h]
+    if grid:
+        pixels[grid_line_mask(H, cell_px, heavy_every, medium_every)[y0:y0 + h]] = GRID_COLOR
+    return np.ascontiguousarray(pixels)
+
+
+def rasterize_symbols(idx_map, symbol_lut, tiles, cell_px, x0, y0, w, h, heavy_every, medium_every, grid=True):
+    """Render black-on-white symbol chart pixels (grayscale) for the window [x0, x0+w) x [y0, y0+h)"""
+    H, W = idx_map.shape
+    sx0, sy0, sx1, sy1 = stitch_window(x0, y0, w, h, cell_px)
+    ox = x0 - sx0 * cell_px
+    oy = y0 - sy0 * cell_px
+
+    # (rows, cols, cell, cell) glyph tiles laid out as one pixel block
+    glyphs = tiles[symbol_lut[idx_map[sy0:sy1, sx0:sx1]]]
+    hs, ws = glyphs.shape[:2]
+    pixels = 255 - glyphs.transpose(0, 2, 1, 3).reshape(hs * cell_px, ws * cell_px)[oy:oy + h, ox:ox + w]
+    if grid:
+        pixels[:, grid_line_mask(W, cell_px, heavy_every, medium_every)[x0:x0 + w]] = 0
+        pixels[grid_line_mask(H, cell_px, heavy_every, medium_every)[y0:y0 + h]] = 0
+    return np.ascontiguousarray(pixels)
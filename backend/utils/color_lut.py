@@ -0,0 +1,157 @@
+# RGB -> Palette Lookup Tables
+# The RGB cube is quantized to LUT_BITS per channel and the nearest palette
+# entry is precomputed for every cell. A cell is only trusted when every RGB
+# value inside it provably shares that nearest entry. Boundary cells instead
+# point at a short list of the palette entries that can win somewhere in the
+# cell, and pixels landing there are refined exactly against that list.
+# Tables are built per (palette, metric); see utils.color_metrics.
+
+import hashlib
+import itertools
+import os
+import threading
+import numpy as np
+from utils.color_metrics import (
+    CHUNK, DEFAULT_METRIC, get_lab_index, metric_distance, srgb_to_lab, to_metric_space
+)
+
+LUT_BITS = 6
+
+_LUT_CACHE = {}
+_LOCK = threading.Lock()
+
+
+def palette_hash(palette_rgb, bits=LUT_BITS, metric=DEFAULT_METRIC):
+    """Stable key for a palette, metric and LUT resolution"""
+    palette = np.ascontiguousarray(palette_rgb, dtype='<i2')
+    digest = hashlib.sha1(palette.tobytes())
+    digest.update(f"bits={bits};metric={metric}".encode('ascii'))
+    return digest.hexdigest()
+
+
+def _pack_contenders(within):
+    """Turn a boolean (cells, palette) mask into ascending index lists padded with -1"""
+    counts = within.sum(axis=1)
+    packed = np.full((within.shape[0], max(int(counts.max(initial=1)), 1)), -1, dtype=np.int16)
+    rows, cols = np.nonzero(within)
+    packed[rows, np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)] = cols
+    return packed
+
+
+def _search_rgb(cells, palette_rgb, radius):
+    """Nearest entries and boundary contenders for RGB cell centers"""
+    palette = np.asarray(palette_rgb, dtype=np.float64)
+    palette_sq = (palette * palette).sum(axis=1)
+    best = np.empty(cells.shape[0], dtype=np.int32)
+    blocks = []
+
+    for start in range(0, cells.shape[0], CHUNK):
+        block = cells[start:start + CHUNK]
+        block_sq = (block * block).sum(axis=1)
+        dist2 = block_sq[:, None] + palette_sq[None, :] - 2 * (block @ palette.T)
+        dist = np.sqrt(np.maximum(dist2, 0))
+        best[start:start + CHUNK] = dist.argmin(axis=1)
+        blocks.append(_pack_contenders(dist <= (dist.min(axis=1) + 2 * radius + 1e-6)[:, None]))
+
+    width = max(b.shape[1] for b in blocks)
+    contenders = np.full((cells.shape[0], width), -1, dtype=np.int16)
+    row = 0
+    for b in blocks:
+        contenders[row:row + len(b), :b.shape[1]] = b
+        row += len(b)
+    return best, contenders
+
+
+def build_color_lut(palette_rgb, bits=LUT_BITS, metric=DEFAULT_METRIC):
+    """Precompute nearest palette indices for every cell of the quantized RGB cube"""
+    n = 1 << bits
+    step = 1 << (8 - bits)
+    half = (step - 1) / 2.0
+    centers = np.arange(n, dtype=np.float64) * step + half
+    r, g, b = np.meshgrid(centers, centers, centers, indexing='ij')
+    cells = np.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+
+    # Only entries within best + 2 * radius of a cell center can win anywhere
+    # in the cell. In RGB the radius is exact; for Lab metrics it is the
+    # distance to the farthest cell corner, which bounds the cell closely at
+    # this resolution.
+    if metric == 'rgb':
+        best, contenders = _search_rgb(cells, palette_rgb, np.sqrt(3.0) * half)
+    else:
+        lab = srgb_to_lab(cells)
+        radius = np.zeros(cells.shape[0])
+        for offset in itertools.product((-half, half), repeat=3):
+            radius = np.maximum(radius, metric_distance(srgb_to_lab(cells + offset), lab, metric))
+        best, contenders = get_lab_index(palette_rgb).search(lab, metric, margin=2 * radius + 1e-6)
+
+    boundary = contenders[:, 1] >= 0 if contenders.shape[1] > 1 else np.zeros(len(best), dtype=bool)
+    n_boundary = int(boundary.sum())
+    lut = best.astype(np.int32)
+    lut[boundary] = -1 - np.arange(n_boundary)
+    candidates = np.ascontiguousarray(contenders[boundary])
+
+    return lut.astype(np.int32 if n_boundary >= 32768 else np.int16), candidates
+
+
+def get_color_lut(palette_rgb, bits=LUT_BITS, cache_dir=None, metric=DEFAULT_METRIC):
+    """Fetch the LUT for a palette from memory, disk or by building it"""
+    key = palette_hash(palette_rgb, bits, metric)
+    tables = _LUT_CACHE.get(key)
+    if tables is not None:
+        return tables
+    # Bands of one conversion ask for the same table at once; build it once
+    with _LOCK:
+        tables = _LUT_CACHE.get(key)
+        if tables is None:
+            tables = _LUT_CACHE[key] = _load_color_lut(palette_rgb, bits, cache_dir, metric, key)
+    return tables
+
+
+def _load_color_lut(palette_rgb, bits, cache_dir, metric, key):
+    path = os.path.join(cache_dir, f"lut_{key}.npz") if cache_dir else None
+    if path and os.path.exists(path):
+        with np.load(path) as data:
+            tables = data['lut'], data['candidates']
+    else:
+        tables = build_color_lut(palette_rgb, bits, metric)
+        if path:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, lut=tables[0], candidates=tables[1])
+            os.replace(tmp_path, path)
+
+    for table in tables:
+        table.setflags(write=False)
+    return tables
+
+
+def lookup_nearest(pixels, palette_rgb, metric=DEFAULT_METRIC, bits=LUT_BITS, cache_dir=None):
+    """Nearest palette index for each uint8 RGB pixel via the cached LUT"""
+    pixels = pixels.reshape(-1, 3)
+    lut, candidates = get_color_lut(palette_rgb, bits, cache_dir, metric)
+
+    q = (pixels >> (8 - bits)).astype(np.int32)
+    cell = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    idx = lut[cell].astype(np.int32)
+
+    # Exact refinement for pixels that fell in boundary cells. Each distinct
+    # color is refined once, one candidate column at a time; padding slots
+    # (-1) never win.
+    boundary = np.flatnonzero(idx < 0)
+    if len(boundary):
+        packed = (pixels[boundary].astype(np.int32) * [65536, 256, 1]).sum(axis=1)
+        colors, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+        cand = candidates[-1 - idx[boundary[first]]]
+        palette = to_metric_space(np.asarray(palette_rgb), metric)
+        px = to_metric_space(pixels[boundary[first]], metric)
+        best_dist = np.full(len(colors), np.inf)
+        best_idx = np.zeros(len(colors), dtype=np.int32)
+        for k in range(cand.shape[1]):
+            col = cand[:, k]
+            dist = metric_distance(palette[col], px, metric)
+            closer = (dist < best_dist) & (col >= 0)
+            best_dist[closer] = dist[closer]
+            best_idx[closer] = col[closer]
+        idx[boundary] = best_idx[inverse.ravel()]
+    return idx
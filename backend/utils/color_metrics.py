@@ -0,0 +1,234 @@
+# Color Distance Metrics
+# 'rgb' is plain Euclidean distance on sRGB values, 'cie76' is Euclidean
+# distance in CIELAB and 'ciede2000' is the CIEDE2000 color difference.
+# Perceptual searches go through LabIndex, a bucketed grid over the
+# palette's Lab coordinates, so only nearby threads are ever compared.
+
+import hashlib
+import numpy as np
+
+METRICS = ('rgb', 'cie76', 'ciede2000')
+DEFAULT_METRIC = 'rgb'
+LAB_BUCKET = 10.0
+CIEDE2000_REACH = 3.0
+CHUNK = 16384
+
+# sRGB (D65) -> XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+
+_PALETTE_LAB_CACHE = {}
+_LAB_INDEX_CACHE = {}
+
+
+def srgb_to_lab(rgb):
+    """Convert sRGB values (0-255, last axis RGB) to CIELAB"""
+    c = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE_D65
+
+    eps = (6.0 / 29.0) ** 3
+    f = np.where(xyz > eps, np.cbrt(xyz), xyz / (3 * (6.0 / 29.0) ** 2) + 4.0 / 29.0)
+    L = 116.0 * f[..., 1] - 16.0
+    a = 500.0 * (f[..., 0] - f[..., 1])
+    b = 200.0 * (f[..., 1] - f[..., 2])
+    return np.stack([L, a, b], axis=-1)
+
+
+def delta_e_cie76(lab1, lab2):
+    """CIE76 color difference, broadcasting over leading axes"""
+    diff = np.asarray(lab1) - np.asarray(lab2)
+    return np.sqrt((diff * diff).sum(axis=-1))
+
+
+def delta_e_ciede2000(lab1, lab2):
+    """CIEDE2000 color difference, broadcasting over leading axes"""
+    lab1 = np.asarray(lab1, dtype=np.float64)
+    lab2 = np.asarray(lab2, dtype=np.float64)
+    L1, a1, b1 = lab1[..., 0], lab1[..., 1], lab1[..., 2]
+    L2, a2, b2 = lab2[..., 0], lab2[..., 1], lab2[..., 2]
+
+    C_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2.0
+    C_bar7 = C_bar ** 7
+    G = 0.5 * (1.0 - np.sqrt(C_bar7 / (C_bar7 + 25.0 ** 7)))
+    a1p = (1.0 + G) * a1
+    a2p = (1.0 + G) * a2
+    C1p = np.hypot(a1p, b1)
+    C2p = np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360.0
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360.0
+    chroma_zero = C1p * C2p == 0
+
+    dLp = L2 - L1
+    dCp = C2p - C1p
+    dhp = h2p - h1p
+    dhp = np.where(dhp > 180.0, dhp - 360.0, dhp)
+    dhp = np.where(dhp < -180.0, dhp + 360.0, dhp)
+    dhp = np.where(chroma_zero, 0.0, dhp)
+    dHp = 2.0 * np.sqrt(C1p * C2p) * np.sin(np.radians(dhp) / 2.0)
+
+    Lbp = (L1 + L2) / 2.0
+    Cbp = (C1p + C2p) / 2.0
+    hsum = h1p + h2p
+    hbp = np.where(np.abs(h1p - h2p) > 180.0,
+                   np.where(hsum < 360.0, hsum + 360.0, hsum - 360.0), hsum) / 2.0
+    hbp = np.where(chroma_zero, hsum, hbp)
+
+    T = (1.0 - 0.17 * np.cos(np.radians(hbp - 30.0))
+         + 0.24 * np.cos(np.radians(2.0 * hbp))
+         + 0.32 * np.cos(np.radians(3.0 * hbp + 6.0))
+         - 0.20 * np.cos(np.radians(4.0 * hbp - 63.0)))
+    d_theta = 30.0 * np.exp(-(((hbp - 275.0) / 25.0) ** 2))
+    Cbp7 = Cbp ** 7
+    R_C = 2.0 * np.sqrt(Cbp7 / (Cbp7 + 25.0 ** 7))
+    S_L = 1.0 + 0.015 * (Lbp - 50.0) ** 2 / np.sqrt(20.0 + (Lbp - 50.0) ** 2)
+    S_C = 1.0 + 0.045 * Cbp
+    S_H = 1.0 + 0.015 * Cbp * T
+    R_T = -np.sin(np.radians(2.0 * d_theta)) * R_C
+
+    tL = dLp / S_L
+    tC = dCp / S_C
+    tH = dHp / S_H
+    return np.sqrt(np.maximum(tL * tL + tC * tC + tH * tH + R_T * tC * tH, 0.0))
+
+
+def to_metric_space(rgb, metric):
+    """Convert sRGB values into the coordinates a metric measures distance in"""
+    if metric == 'rgb':
+        return np.asarray(rgb, dtype=np.float64)
+    return srgb_to_lab(rgb)
+
+
+def metric_distance(a, b, metric):
+    """Distance between points already in the metric's coordinate space"""
+    if metric == 'ciede2000':
+        return delta_e_ciede2000(a, b)
+    return delta_e_cie76(a, b)
+
+
+def _palette_key(palette_rgb):
+    return hashlib.sha1(np.ascontiguousarray(palette_rgb, dtype='<i2').tobytes()).hexdigest()
+
+
+def palette_lab(palette_rgb):
+    """Cached Lab coordinates of a palette"""
+    key = _palette_key(palette_rgb)
+    lab = _PALETTE_LAB_CACHE.get(key)
+    if lab is None:
+        lab = srgb_to_lab(np.asarray(palette_rgb))
+        lab.setflags(write=False)
+        _PALETTE_LAB_CACHE[key] = lab
+    return lab
+
+
+class LabIndex:
+    """Bucketed grid over palette Lab coordinates for nearest-thread queries"""
+
+    def __init__(self, lab, bucket=LAB_BUCKET):
+        self.lab = np.asarray(lab, dtype=np.float64)
+        self.bucket = bucket
+        self._shortlists = {}
+
+    def _shortlist(self, key, metric, margin):
+        """Palette rows that can be nearest (within margin) to any point of a bucket"""
+        margin = np.ceil(margin * 100.0) / 100.0
+        cache_key = (key, metric, margin)
+        rows = self._shortlists.get(cache_key)
+        if rows is not None:
+            return rows
+
+        lo = np.array(key, dtype=np.float64) * self.bucket
+        hi = lo + self.bucket
+        gap = np.maximum(np.maximum(lo - self.lab, self.lab - hi), 0.0)
+        near = np.sqrt((gap * gap).sum(axis=1))
+        span = np.maximum(np.abs(self.lab - lo), np.abs(self.lab - hi))
+        far = np.sqrt((span * span).sum(axis=1))
+
+        # Exact for CIE76. CIEDE2000 is not a Euclidean metric, so it searches
+        # the CIE76 shortlist out to three times the nearest bound, which
+        # agrees with a full palette scan on all but a handful of near-ties.
+        bound = far.min()
+        if metric == 'ciede2000':
+            bound *= CIEDE2000_REACH
+        rows = np.flatnonzero(near <= bound + margin)
+        self._shortlists[cache_key] = rows
+        return rows
+
+    def search(self, lab_points, metric='cie76', margin=None):
+        """Nearest palette row per point, plus rows within margin of the best if given
+
+        margin may be a scalar or one value per point. Contender lists come back
+        as an (N, K) array in ascending palette order padded with -1.
+        """
+        points = np.asarray(lab_points, dtype=np.float64).reshape(-1, 3)
+        n = points.shape[0]
+        best = np.zeros(n, dtype=np.int32)
+        margins = None if margin is None else np.broadcast_to(np.asarray(margin, dtype=np.float64), (n,))
+        groups = []
+
+        keys = np.floor(points / self.bucket).astype(np.int64)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        order = np.argsort(inverse.ravel(), kind='stable')
+        bounds = np.cumsum(np.bincount(inverse.ravel(), minlength=len(uniq)))
+
+        start = 0
+        for g, end in enumerate(bounds):
+            members = order[start:end]
+            start = end
+            group_margin = 0.0 if margins is None else float(margins[members].max())
+            rows = self._shortlist(tuple(uniq[g].tolist()), metric, group_margin)
+            dist = metric_distance(points[members][:, None, :], self.lab[rows][None, :, :], metric)
+            best[members] = rows[dist.argmin(axis=1)]
+            if margins is not None:
+                within = dist <= (dist.min(axis=1) + margins[members])[:, None]
+                groups.append((members, rows, within))
+
+        if margins is None:
+            return best
+
+        width = max(int(within.sum(axis=1).max()) for _, _, within in groups) if groups else 1
+        contenders = np.full((n, width), -1, dtype=np.int16)
+        for members, rows, within in groups:
+            counts = within.sum(axis=1)
+            r, c = np.nonzero(within)
+            slot = np.arange(len(r)) - np.repeat(np.cumsum(counts) - counts, counts)
+            contenders[members[r], slot] = rows[c]
+        return best, contenders
+
+
+def get_lab_index(palette_rgb):
+    """Cached LabIndex for a palette"""
+    key = _palette_key(palette_rgb)
+    index = _LAB_INDEX_CACHE.get(key)
+    if index is None:
+        index = LabIndex(palette_lab(palette_rgb))
+        _LAB_INDEX_CACHE[key] = index
+    return index
+
+
+def nearest_indices_rgb(pixels, palette_rgb):
+    """Brute-force nearest palette index for each RGB pixel"""
+    img = np.asarray(pixels).reshape(-1, 3).astype(np.int32)
+    palette = np.asarray(palette_rgb, dtype=np.int32)
+    palette_sq = (palette * palette).sum(axis=1)
+    best_idx = np.zeros(img.shape[0], dtype=np.int32)
+
+    # |p - c|^2 = |p|^2 - 2 p.c + |c|^2; |p|^2 is constant per pixel so it is dropped
+    for start in range(0, img.shape[0], CHUNK):
+        block = img[start:start + CHUNK]
+        dist2 = palette_sq[None, :] - 2 * (block @ palette.T)
+        best_idx[start:start + CHUNK] = dist2.argmin(axis=1)
+
+    return best_idx
+
+
+def nearest_indices(pixels, palette_rgb, metric=DEFAULT_METRIC):
+    """Nearest palette index for each RGB pixel under the given metric"""
+    pixels = np.asarray(pixels).reshape(-1, 3)
+    if metric == 'rgb':
+        return nearest_indices_rgb(pixels, palette_rgb)
+    return get_lab_index(palette_rgb).search(srgb_to_lab(pixels), metric)
@@ -0,0 +1,141 @@
+# Dithering
+# Maps an RGB stitch grid onto a (usually reduced) palette while spreading
+# the quantization error, so gradients come out as mixed stitches instead of
+# flat bands. Ordered (Bayer) dithering is a single vectorized pass.
+# Error diffusion keeps the exact sequential result of a row-by-row scan but
+# runs as a wavefront: every stitch on the line slope*y + x = t only receives
+# error from earlier lines, so each line is processed as one vector step.
+# Both work in the coordinates of the conversion's color metric: error is
+# spread in RGB or CIELAB, and each stitch takes the palette color that is
+# nearest under that metric. Wavefront steps are short vectors where numpy's
+# per-call overhead dominates, so palette terms are computed once, pending
+# error lives in a small ring of contiguous lines and buffers are reused.
+
+import numpy as np
+from utils.color_metrics import DEFAULT_METRIC, delta_e_ciede2000, to_metric_space
+
+DITHER_MODES = ('none', 'floyd-steinberg', 'atkinson', 'ordered')
+
+CHUNK = 16384
+CIEDE2000_CHUNK = 1024  # every value is compared with every palette color
+
+# Range of each coordinate that values are clipped to while error spreads
+_RGB_BOUNDS = (np.zeros(3), np.full(3, 255.0))
+_LAB_BOUNDS = (np.array([0.0, -128.0, -128.0]), np.array([100.0, 127.0, 127.0]))
+
+# (dy, dx, weight) taps spreading a stitch's error to unvisited neighbours
+KERNELS = {
+    'floyd-steinberg': ((0, 1, 7 / 16), (1, -1, 3 / 16), (1, 0, 5 / 16), (1, 1, 1 / 16)),
+    'atkinson': ((0, 1, 1 / 8), (0, 2, 1 / 8), (1, -1, 1 / 8), (1, 0, 1 / 8), (1, 1, 1 / 8), (2, 0, 1 / 8)),
+}
+
+
+def bayer_matrix(n=8):
+    """n x n Bayer threshold matrix scaled to [-0.5, 0.5)"""
+    m = np.zeros((1, 1), dtype=np.float64)
+    while m.shape[0] < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return (m + 0.5) / m.size - 0.5
+
+
+class _Nearest:
+    """Nearest palette row for values in the metric's coordinates, with palette terms precomputed"""
+
+    def __init__(self, palette, metric, size):
+        self.palette = palette
+        self.metric = metric
+        self.palette_sq = (palette * palette).sum(axis=1)
+        self.twice_t = np.ascontiguousarray(2 * palette.T)
+        self._dist = np.empty((size, len(palette)))
+
+    def __call__(self, values):
+        if self.metric == 'ciede2000':
+            return delta_e_ciede2000(values[:, None, :], self.palette[None, :, :]).argmin(axis=1)
+        # |v|^2 is the same for every row so it is dropped
+        dist = np.matmul(values, self.twice_t, out=self._dist[:len(values)])
+        np.subtract(self.palette_sq, dist, out=dist)
+        return dist.argmin(axis=1)
+
+
+def _metric_space(pixels, palette_rgb, metric):
+    """Pixels, palette and clip bounds in the coordinates the metric measures distance in"""
+    bounds = _RGB_BOUNDS if metric == 'rgb' else _LAB_BOUNDS
+    return to_metric_space(pixels, metric), to_metric_space(palette_rgb, metric), bounds
+
+
+def palette_spread(palette):
+    """Median distance from each palette color to its nearest other color"""
+    if len(palette) < 2:
+        return 0.0
+    dist = np.sqrt(((palette[:, None, :] - palette[None, :, :]) ** 2).sum(axis=2))
+    np.fill_diagonal(dist, np.inf)
+    return float(np.median(dist.min(axis=1)))
+
+
+def dither_ordered(pixels, palette_rgb, metric=DEFAULT_METRIC):
+    """Bayer ordered dither of an (H, W, 3) grid; returns palette indices (H, W)"""
+    H, W, _ = pixels.shape
+    values, palette, (lo, hi) = _metric_space(pixels, palette_rgb, metric)
+    threshold = bayer_matrix(8)
+    offset = np.tile(threshold, (-(-H // 8), -(-W // 8)))[:H, :W, None] * palette_spread(palette)
+    values = np.clip(values + offset, lo, hi).reshape(-1, 3)
+    chunk = CIEDE2000_CHUNK if metric == 'ciede2000' else CHUNK
+    nearest = _Nearest(palette, metric, min(chunk, H * W))
+    out = np.empty(H * W, dtype=np.int64)
+    for start in range(0, H * W, chunk):
+        out[start:start + chunk] = nearest(values[start:start + chunk])
+    return out.reshape(H, W)
+
+
+def dither_error_diffusion(pixels, palette_rgb, kernel, metric=DEFAULT_METRIC):
+    """Error-diffusion dither of an (H, W, 3) grid; returns palette indices (H, W)"""
+    H, W, _ = pixels.shape
+    pixels, palette, (lo, hi) = _metric_space(pixels, palette_rgb, metric)
+    pixels = pixels.reshape(-1, 3)
+
+    # Smallest integer slope putting every tap on a later wavefront line
+    slope = max(-(-(1 - dx) // dy) for dy, dx, _ in kernel if dy > 0)
+    # A tap (dy, dx) from stitch y of line t lands on stitch y + dy of line
+    # t + ahead, so pending error only needs a ring of the next few lines,
+    # each indexed by y and contiguous, instead of the whole padded grid
+    aheads = [slope * dy + dx for dy, dx, _ in kernel]
+    ring = max(aheads) + 1
+    pending = np.zeros((ring, H + max(dy for dy, _, _ in kernel), 3))
+    weights = np.array([weight for _, _, weight in kernel])[:, None, None]
+    # Flat index of stitch y on line t is base[y] + t
+    base = np.arange(H) * (W - slope)
+    out = np.empty(H * W, dtype=np.int64)
+
+    # Scratch space for the longest wavefront line
+    longest = min(H, -(-W // slope) + 1)
+    nearest = _Nearest(palette, metric, longest)
+    line = np.empty((longest, 3))
+    chosen = np.empty((longest, 3))
+    spread = np.empty((len(kernel), longest, 3))
+
+    for t in range(slope * (H - 1) + W):
+        y_lo = max(0, -(-(t - W + 1) // slope))
+        n = min(H - 1, t // slope) - y_lo + 1
+        index = base[y_lo:y_lo + n] + t
+        values = pixels.take(index, axis=0, out=line[:n])
+        error = pending[t % ring]
+        values += error[y_lo:y_lo + n]
+        error.fill(0.0)
+        np.maximum(values, lo, out=values)
+        np.minimum(values, hi, out=values)
+        best = nearest(values)
+        out[index] = best
+        values -= palette.take(best, axis=0, out=chosen[:n])
+        np.multiply(weights, values, out=spread[:, :n])
+        for (dy, _, _), ahead, share in zip(kernel, aheads, spread):
+            pending[(t + ahead) % ring, y_lo + dy:y_lo + dy + n] += share[:n]
+    return out.reshape(H, W)
+
+
+def dither_indices(pixels, palette_rgb, mode, metric=DEFAULT_METRIC):
+    """Palette indices (H, W) for an RGB grid under a dither mode and color metric"""
+    if mode == 'ordered':
+        return dither_ordered(pixels, palette_rgb, metric)
+    if mode in KERNELS:
+        return dither_error_diffusion(pixels, palette_rgb, KERNELS[mode], metric)
+    raise ValueError(f"Unknown dither mode '{mode}'")
@@ -0,0 +1,45 @@
+# Glyph Atlas
+# Chart symbols are rendered once per (symbol set, cell size, font) into
+# small coverage tiles, so symbol charts are assembled by array indexing
+# instead of laying out text for every stitch. Fonts are shared process-wide.
+
+from functools import lru_cache
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_NAME = "DejaVuSansMono.ttf"
+GLYPH_SCALE = 0.6
+
+
+@lru_cache(maxsize=32)
+def get_font(name, size):
+    """Load a TrueType font once per (name, size), falling back to the default font"""
+    try:
+        return ImageFont.truetype(name, size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def chart_font(cell_px, font_name=FONT_NAME):
+    """Font used for symbols in a chart with the given cell size"""
+    return get_font(font_name, max(int(cell_px*GLYPH_SCALE), 1))
+
+
+@lru_cache(maxsize=16)
+def glyph_atlas(symbols, cell_px, font_name=FONT_NAME):
+    """Coverage tiles (len(symbols), cell_px, cell_px) with each symbol centred in its cell"""
+    font = chart_font(cell_px, font_name)
+    tiles = np.zeros((len(symbols), cell_px, cell_px), dtype=np.uint8)
+    tile = Image.new("L", (cell_px, cell_px), 0)
+    draw = ImageDraw.Draw(tile)
+
+    for i, s in enumerate(symbols):
+        draw.rectangle([0, 0, cell_px, cell_px], fill=0)
+        left, top, right, bottom = draw.textbbox((0, 0), s, font=font)
+        tx = (cell_px - (right - left))//2 - left
+        ty = (cell_px - (bottom - top))//2 - top
+        draw.text((tx, ty), s, fill=255, font=font)
+        tiles[i] = np.asarray(tile)
+
+    tiles.setflags(write=False)
+    return tiles
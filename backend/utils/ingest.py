@@ -0,0 +1,151 @@
+# Image Ingestion
+# Uploads are decoded at the lowest resolution that still feeds a good
+# LANCZOS resize to the stitch grid: JPEGs are DCT-scaled while decoding
+# (draft mode) and other formats are shrunk by integer reduce() steps before
+# the final resample. Images are turned upright from their EXIF orientation,
+# and oversized dimensions are rejected from the header, before any pixel
+# data is read.
+
+import io
+import sys
+import time
+from PIL import Image
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+MAX_IMAGE_PIXELS = 64 * 1024 * 1024
+REDUCING_GAP = 3.0  # keep at least this many source pixels per stitch before LANCZOS
+WORKING_MAX_SIDE = 3000  # working copies keep REDUCING_GAP pixels per stitch up to 1000-stitch canvases
+
+# EXIF orientation -> transpose that makes the image upright
+_ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_SWAPS_AXES = (Image.Transpose.TRANSPOSE, Image.Transpose.TRANSVERSE,
+               Image.Transpose.ROTATE_90, Image.Transpose.ROTATE_270)
+
+
+class ImageRejected(ValueError):
+    """Raised for uploads that cannot or should not be decoded"""
+
+
+def _peak_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def probe_image(fp, max_pixels=MAX_IMAGE_PIXELS):
+    """Read only the header of an image (path or file object) and reject unreadable or oversized files"""
+    try:
+        with Image.open(fp) as img:
+            width, height = img.size
+            fmt = img.format
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageRejected(f"Unreadable image: {e}")
+    if width * height > max_pixels:
+        raise ImageRejected(f"Image is {width}x{height}; at most {max_pixels} pixels are accepted")
+    return width, height, fmt
+
+
+def open_decoded(path, stitch_sizes, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode an image once, at a resolution that serves every (w, h) in stitch_sizes
+
+    Returns the RGB image in stored orientation, the transpose that makes it
+    upright, and decode stats.
+    """
+    start = time.perf_counter()
+    rss_before = _peak_rss_bytes()
+    with Image.open(path) as img:
+        width, height = img.size
+        if width * height > max_pixels:
+            raise ImageRejected(f"Image is {width}x{height}; at most {max_pixels} pixels are accepted")
+
+        # Work in stored orientation and only turn the small results upright
+        transpose = _ORIENTATION_TRANSPOSE.get(img.getexif().get(0x0112))
+        want_w = max(w for w, h in stitch_sizes)
+        want_h = max(h for w, h in stitch_sizes)
+        if transpose in _SWAPS_AXES:
+            want_w, want_h = want_h, want_w
+        fmt = img.format
+        if fmt == 'JPEG':
+            img.draft('RGB', (int(want_w * REDUCING_GAP), int(want_h * REDUCING_GAP)))
+
+        img.load()
+        rgb = img if img.mode == 'RGB' else img.convert('RGB')
+
+    stats = {
+        'format': fmt,
+        'source_size': (width, height),
+        'decoded_size': rgb.size,
+        'decoded_bytes': rgb.size[0] * rgb.size[1] * 3,
+        'decode_ms': round((time.perf_counter() - start) * 1000, 2),
+        'peak_rss_growth': max(_peak_rss_bytes() - rss_before, 0)
+    }
+    return rgb, transpose, stats
+
+
+def resize_decoded(rgb, transpose, stitches_w, stitches_h):
+    """Upright stitches_w x stitches_h LANCZOS resize of an open_decoded image"""
+    if transpose in _SWAPS_AXES:
+        out = rgb.resize((stitches_h, stitches_w), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    else:
+        out = rgb.resize((stitches_w, stitches_h), Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+    return out.transpose(transpose) if transpose is not None else out
+
+
+def load_for_stitches(path, stitches_w, stitches_h, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode an image straight to an upright RGB stitch grid, with decode stats"""
+    rgb, transpose, stats = open_decoded(path, [(stitches_w, stitches_h)], max_pixels)
+    return resize_decoded(rgb, transpose, stitches_w, stitches_h), stats
+
+
+def working_copy_extension(fp, max_side=WORKING_MAX_SIDE):
+    """Extension working_copy will write for an image, from its header, or None when it is kept as uploaded"""
+    with Image.open(fp) as img:
+        transpose = _ORIENTATION_TRANSPOSE.get(img.getexif().get(0x0112))
+        if max(img.size) <= max_side and transpose is None:
+            return None
+        return 'jpg' if img.format == 'JPEG' else 'png'
+
+
+def working_copy(fp, max_side=WORKING_MAX_SIDE):
+    """Upright RGB copy of an image at most max_side pixels on its longest side
+
+    Returns (bytes, extension), or None when the image is already small and
+    upright and can be kept as uploaded. JPEGs stay JPEG; anything else is
+    written as PNG.
+    """
+    with Image.open(fp) as img:
+        width, height = img.size
+        transpose = _ORIENTATION_TRANSPOSE.get(img.getexif().get(0x0112))
+        if max(width, height) <= max_side and transpose is None:
+            return None
+        fmt = img.format
+        scale = min(1.0, max_side / max(width, height))
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if fmt == 'JPEG':
+            img.draft('RGB', size)
+        img.load()
+        rgb = img if img.mode == 'RGB' else img.convert('RGB')
+        if rgb.size != size:
+            rgb = rgb.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
+        if transpose is not None:
+            rgb = rgb.transpose(transpose)
+
+    buf = io.BytesIO()
+    if fmt == 'JPEG':
+        rgb.save(buf, format='JPEG', quality=92)
+        return buf.getvalue(), 'jpg'
+    rgb.save(buf, format='PNG')
+    return buf.getvalue(), 'png'
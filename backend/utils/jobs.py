@@ -0,0 +1,121 @@
+# Background Conversion Jobs
+# Pattern conversions run in a local process pool so web workers only parse
+# the request and hand the work off. The queue is bounded, each owner (a user
+# id or client address) may only have a few jobs in flight, and finished jobs
+# are kept for a while so clients can poll for their results. Workers are
+# started from a fork server (or spawned) rather than forked from the web
+# process, whose threads may hold locks that a forked copy would never see
+# released.
+
+import multiprocessing
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.metrics import metrics, traced_call
+
+
+class JobRejected(Exception):
+    """Raised when a job cannot be queued right now"""
+
+
+class Job:
+    """One submitted conversion and its future"""
+
+    def __init__(self, owner, future, meta):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.future = future
+        self.meta = meta
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+        self.value = None
+
+    @property
+    def status(self):
+        if self.cancelled or self.future.cancelled():
+            return 'cancelled'
+        if self.finished_at is None:
+            return 'running' if self.future.running() or self.future.done() else 'queued'
+        if self.future.exception() is not None or self.value is None:
+            return 'failed'
+        return 'done'
+
+
+class JobManager:
+    """Bounded process pool with per-owner limits and cancellation"""
+
+    def __init__(self, workers=None, max_pending=32, max_per_owner=2, result_ttl=600, start_method=None):
+        self.workers = workers
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.start_method = start_method
+        self.max_pending = max_pending
+        self.max_per_owner = max_per_owner
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created on first use so importing the app never forks workers
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(self.start_method))
+        return self._executor
+
+    def _prune(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [k for k, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _finished(self, job):
+        # Workers trace their stages; fold them into this process's metrics
+        if not job.future.cancelled() and job.future.exception() is None:
+            job.value, spans = job.future.result()
+            metrics.record_spans(spans)
+        job.finished_at = time.time()
+
+    def submit(self, owner, fn, *args, meta=None):
+        """Queue fn(*args) for owner and return the Job, or raise JobRejected"""
+        with self._lock:
+            self._prune()
+            active = [job for job in self._jobs.values() if job.finished_at is None]
+            if len(active) >= self.max_pending:
+                raise JobRejected('Conversion queue is full, try again shortly')
+            if sum(1 for job in active if job.owner == owner) >= self.max_per_owner:
+                raise JobRejected('Too many conversions in progress')
+
+            try:
+                future = self._pool().submit(traced_call, fn, *args)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory); start a fresh pool
+                self._executor = None
+                future = self._pool().submit(traced_call, fn, *args)
+            job = Job(owner, future, meta or {})
+            self._jobs[job.id] = job
+        job.future.add_done_callback(lambda _: self._finished(job))
+        return job
+
+    def get(self, job_id, owner):
+        """Job by id if it belongs to owner"""
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job
+
+    def result(self, job):
+        """Return value of a finished job, None if it failed or was cancelled"""
+        if job.status != 'done':
+            return None
+        return job.value
+
+    def cancel(self, job):
+        """Cancel a job; one already running finishes but its result is dropped"""
+        if not job.future.cancel() and not job.future.done():
+            job.cancelled = True
+        return job.status
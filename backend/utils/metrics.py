@@ -0,0 +1,207 @@
+# Pipeline Metrics
+# In-process histograms for pipeline stage timings and sizes, request
+# latency and error counts, rendered in the Prometheus text format. Stages
+# can also be collected per request (or per background job) as a trace.
+# The trace is a context variable, so work handed to other threads under
+# contextvars.copy_context().run adds its stages to the caller's trace.
+# While disabled, stage() hands back one shared no-op object, so
+# instrumented code pays a single attribute check.
+
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8, 1e9)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            base = ','.join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            sep = ',' if base else ''
+            running = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                running += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {running}')
+            suffix = f"{{{base}}}" if base else ''
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+
+    def inc(self, labels, amount=1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            base = ','.join(f'{k}="{v}"' for k, v in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{base}}} {value}")
+        return lines
+
+
+class _NoopStage:
+    """Stand-in for a stage timer while metrics are disabled"""
+    nbytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP_STAGE = _NoopStage()
+
+
+class _Stage:
+    """Times one pipeline stage; set .nbytes inside the block to record a size"""
+    __slots__ = ('metrics', 'name', 'nbytes', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.nbytes = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe_stage(self.name, time.perf_counter() - self.start, self.nbytes)
+        return False
+
+
+class Metrics:
+    """Registry of the app's histograms and counters"""
+
+    def __init__(self, enabled=False, prefix='needlepoint'):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._spans = contextvars.ContextVar(f"{prefix}_spans", default=None)
+        self.stage_seconds = Histogram(f"{prefix}_stage_seconds", "Pipeline stage wall time",
+                                       ('stage',), SECONDS_BUCKETS)
+        self.stage_bytes = Histogram(f"{prefix}_stage_bytes", "Pipeline stage output size",
+                                     ('stage',), BYTES_BUCKETS)
+        self.request_seconds = Histogram(f"{prefix}_request_seconds", "HTTP request latency",
+                                         ('endpoint', 'method', 'status'), SECONDS_BUCKETS)
+        self.response_bytes = Histogram(f"{prefix}_response_bytes", "HTTP response body size",
+                                        ('endpoint',), BYTES_BUCKETS)
+        self.errors = Counter(f"{prefix}_errors_total", "Failures by location", ('where',))
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        if not self.enabled:
+            return _NOOP_STAGE
+        return _Stage(self, name)
+
+    def timed(self, name):
+        """Decorator timing every call of a function as stage name"""
+        def decorate(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with _Stage(self, name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def observe_stage(self, name, seconds, nbytes=None):
+        with self._lock:
+            self.stage_seconds.observe((name,), seconds)
+            if nbytes is not None:
+                self.stage_bytes.observe((name,), nbytes)
+        spans = self._spans.get()
+        if spans is not None:
+            spans.append((name, seconds, nbytes))
+
+    def record_spans(self, spans):
+        """Add stages traced in another process (e.g. a job worker)"""
+        if not self.enabled:
+            return
+        for name, seconds, nbytes in spans:
+            self.observe_stage(name, seconds, nbytes)
+
+    def observe_request(self, endpoint, method, status, seconds, nbytes=None):
+        if self.enabled:
+            with self._lock:
+                self.request_seconds.observe((endpoint or 'unknown', method, str(status)), seconds)
+                if nbytes is not None:
+                    self.response_bytes.observe((endpoint or 'unknown',), nbytes)
+
+    def count_error(self, where):
+        if self.enabled:
+            with self._lock:
+                self.errors.inc((where,))
+
+    def start_trace(self):
+        """Collect the stages run in this context until stop_trace()"""
+        self._spans.set([] if self.enabled else None)
+
+    def stop_trace(self):
+        """Stages collected since start_trace() as (name, seconds, bytes)"""
+        spans = self._spans.get()
+        self._spans.set(None)
+        return spans or []
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            for metric in (self.stage_seconds, self.stage_bytes, self.request_seconds, self.response_bytes,
+                           self.errors):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def server_timing(spans):
+    """Server-Timing header value for traced stages, repeated stages summed"""
+    totals = {}
+    for name, seconds, _ in spans:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+def traced_call(fn, *args):
+    """Run fn(*args) with stage tracing; returns (result, spans)"""
+    metrics.start_trace()
+    try:
+        result = fn(*args)
+    finally:
+        spans = metrics.stop_trace()
+    return result, spans
+
+
+metrics = Metrics()
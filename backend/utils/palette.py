@@ -0,0 +1,93 @@
+# Thread Palettes
+# Thread catalogues are loaded once, lazily, from CSV files in
+# data/palettes/<brand>.csv (columns: number, name, r, g, b). A loaded
+# palette is immutable: read-only NumPy arrays for RGB and Lab, a
+# {row: (number, name, rgb)} lookup, and number -> row indexes, so requests
+# reuse the same objects and never rebuild palette tables.
+
+import csv
+import hashlib
+import json
+import os
+import threading
+from types import MappingProxyType
+import numpy as np
+from utils.color_metrics import palette_lab
+
+PALETTE_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'palettes')
+DEFAULT_BRAND = 'dmc'
+
+_PALETTES = {}
+_LOCK = threading.Lock()
+
+
+def _parse_number(value):
+    """Thread numbers are ints where possible ('310'), strings otherwise ('B5200')"""
+    value = value.strip()
+    return int(value) if value.isdigit() else value
+
+
+class Palette:
+    """One brand's thread catalogue, in file order"""
+
+    def __init__(self, brand, entries):
+        self.brand = brand
+        self.colors = tuple(entries)
+        self.numbers = tuple(number for number, _, _ in self.colors)
+
+        self.rgb = np.array([rgb for _, _, rgb in self.colors], dtype=np.int16).reshape(-1, 3)
+        self.rgb.setflags(write=False)
+        self.lab = palette_lab(self.rgb)
+        self.lookup = MappingProxyType({i: color for i, color in enumerate(self.colors)})
+
+        # Number -> row as a dict, plus a dense array for integer numbers
+        self.row_of = MappingProxyType({number: i for i, number in enumerate(self.numbers)})
+        int_numbers = [n for n in self.numbers if isinstance(n, int)]
+        self.number_rows = np.full(max(int_numbers, default=-1) + 1, -1, dtype=np.int32)
+        for number in int_numbers:
+            self.number_rows[number] = self.row_of[number]
+        self.number_rows.setflags(write=False)
+
+        self.version = hashlib.sha1(json.dumps([brand, self.colors]).encode('utf-8')).hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.colors)
+
+    def color(self, number):
+        """(number, name, rgb) for a thread number, or None"""
+        row = self.row_of.get(number)
+        return None if row is None else self.colors[row]
+
+    def rows(self, numbers):
+        """Palette rows for an array of integer thread numbers; -1 where unknown"""
+        numbers = np.asarray(numbers, dtype=np.int64)
+        known = (numbers >= 0) & (numbers < len(self.number_rows))
+        return np.where(known, self.number_rows[np.where(known, numbers, 0)], -1)
+
+
+def read_palette_file(path, brand):
+    """Parse a palette CSV into a Palette"""
+    entries = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            rgb = tuple(int(row[c]) for c in ('r', 'g', 'b'))
+            if not all(0 <= v <= 255 for v in rgb):
+                raise ValueError(f"{path}: color {row['number']} has RGB {rgb} outside 0-255")
+            entries.append((_parse_number(row['number']), row['name'].strip(), rgb))
+    if not entries:
+        raise ValueError(f"{path}: palette is empty")
+    return Palette(brand, entries)
+
+
+def get_palette(brand=DEFAULT_BRAND):
+    """Shared Palette for a brand, loaded on first use"""
+    palette = _PALETTES.get(brand)
+    if palette is None:
+        with _LOCK:
+            palette = _PALETTES.get(brand)
+            if palette is None:
+                path = os.path.join(PALETTE_FOLDER, f"{brand}.csv")
+                if not os.path.exists(path):
+                    raise KeyError(f"Unknown thread brand '{brand}'")
+                palette = _PALETTES[brand] = read_palette_file(path, brand)
+    return palette
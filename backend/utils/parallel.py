@@ -0,0 +1,97 @@
+# Parallel Row Bands
+# A single large conversion is spread over several cores by splitting the
+# stitch grid into row bands. The per-band work is NumPy, which releases the
+# GIL, so bands run on a shared thread pool and write into disjoint rows of
+# preallocated outputs. Results are always combined in band order, so the
+# output is identical to the serial path for any worker count. Grids below
+# a size threshold are processed as one band on the calling thread.
+
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+BAND_ALIGN = 8  # bands start on multiples of this many rows (the ordered dither tile)
+BANDS_PER_WORKER = 4
+
+
+class BandPool:
+    """Thread pool that maps functions over row bands of a grid"""
+
+    def __init__(self, workers=None, min_cells=250_000):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.min_cells = min_cells
+        self._executor = None
+        self._lock = threading.Lock()
+        # A forked child (e.g. a job worker) inherits the executor but not its threads
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created on first use so importing the app starts no threads
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='band')
+            return self._executor
+
+    def parallel(self, cells):
+        """Whether a grid of this many cells is worth splitting"""
+        return self.workers > 1 and cells >= self.min_cells
+
+    def split(self, height, width):
+        """(y0, y1) row bands covering a grid; a single band when it is small"""
+        if not self.parallel(height * width):
+            return [(0, height)]
+        rows = -(-height // (self.workers * BANDS_PER_WORKER))
+        rows = max(BAND_ALIGN, -(-rows // BAND_ALIGN) * BAND_ALIGN)
+        return [(y, min(y + rows, height)) for y in range(0, height, rows)]
+
+    def map(self, fn, bands):
+        """[fn(band) for band in bands], running bands concurrently"""
+        if len(bands) <= 1 or self.workers == 1:
+            return [fn(band) for band in bands]
+        return list(self._pool().map(fn, bands))
+
+    def imap(self, fn, items, parallel=True):
+        """Yield fn(item) in order with at most a few items in flight at once"""
+        if not parallel or self.workers == 1:
+            for item in items:
+                yield fn(item)
+            return
+        pool = self._pool()
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(fn, item))
+            if len(pending) > self.workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def bincount(self, values, minlength):
+        """np.bincount over a 2-D array, summed band by band"""
+        values = np.asarray(values)
+        bands = self.split(*values.shape)
+        counts = self.map(lambda band: np.bincount(values[band[0]:band[1]].reshape(-1), minlength=minlength),
+                          bands)
+        return np.sum(counts, axis=0)
+
+    def first_seen(self, values):
+        """Distinct values of a 2-D array in order of first appearance, scanning row by row"""
+        values = np.asarray(values)
+        W = values.shape[1]
+
+        def scan(band):
+            unique, first = np.unique(values[band[0]:band[1]].reshape(-1), return_index=True)
+            return unique, first + band[0] * W
+
+        unique, first = (np.concatenate(parts) for parts in zip(*self.map(scan, self.split(*values.shape))))
+        # Earliest occurrence of each value across bands
+        order = np.lexsort((first, unique))
+        unique, first = unique[order], first[order]
+        keep = np.ones(len(unique), dtype=bool)
+        keep[1:] = unique[1:] != unique[:-1]
+        return unique[keep][np.argsort(first[keep], kind='stable')]
@@ -0,0 +1,186 @@
+# Pattern Editing
+# Edits to a saved pattern operate on its compact form: the palette table
+# (one [dmc, name, rgb, symbol] entry per thread) and the index grid.
+#   swap     {'op': 'swap', 'from': 310, 'to': 3371}
+#            replaces a thread in the palette; the grid is untouched
+#   merge    {'op': 'merge', 'from': [310, 3371], 'into': 939}
+#            remaps the grid through a lookup table
+#   repaint  {'op': 'repaint', 'dmc': 310, 'rect': [x0, y0, x1, y1]}
+#            {'op': 'repaint', 'dmc': 310, 'cells': [flat indices]}
+#            optionally 'where': 3371 to repaint only stitches of that thread
+# Per-thread stitch counts are kept up to date from the cells each edit
+# touches; bounding boxes and region counts are refreshed afterwards for the
+# threads an edit touched, from their stitches only. The rows an edit
+# changes are reported so only those bands of the stored grid need to be
+# rewritten.
+
+import numpy as np
+from utils.pattern_format import grid_dtype
+from utils.usage import color_usage
+
+EDIT_OPS = ('swap', 'merge', 'repaint')
+
+
+class EditError(ValueError):
+    """Raised for edit operations that cannot be applied"""
+
+
+class PatternEdit:
+    """Mutable working state of one pattern while a list of edits is applied"""
+
+    def __init__(self, grid, palette, usage, symbols, catalogue):
+        self.grid = np.array(grid, dtype=grid_dtype(len(palette)))
+        self.palette = [list(entry) for entry in palette]
+        self.counts = np.asarray(usage['counts'], dtype=np.int64).copy()
+        self.bbox = list(usage['bbox'])
+        self.regions = list(usage['regions'])
+        self.changed_colors = set()  # palette indices whose stitches moved
+        self.symbols = symbols
+        self.catalogue = catalogue
+        self.changed_rows = None  # (y0, y1) span of rewritten rows, None while the grid is unchanged
+
+    def _mark_rows(self, y0, y1):
+        if self.changed_rows is None:
+            self.changed_rows = (y0, y1)
+        else:
+            self.changed_rows = (min(self.changed_rows[0], y0), max(self.changed_rows[1], y1))
+
+    def index_of(self, dmc):
+        for i, entry in enumerate(self.palette):
+            if entry[0] == dmc:
+                return i
+        return None
+
+    def _existing(self, dmc):
+        i = self.index_of(dmc)
+        if i is None:
+            raise EditError(f"Thread {dmc} is not in this pattern")
+        return i
+
+    def _thread(self, dmc):
+        color = self.catalogue(dmc)
+        if color is None:
+            raise EditError(f"Unknown thread {dmc}")
+        return color
+
+    def ensure_entry(self, dmc):
+        """Palette index of a thread, adding it with a free symbol when missing"""
+        i = self.index_of(dmc)
+        if i is not None:
+            return i
+        number, name, rgb = self._thread(dmc)
+        used = {entry[3] for entry in self.palette}
+        free = [s for s in self.symbols if s not in used]
+        if not free:
+            raise EditError("Not enough symbols for another color")
+        self.palette.append([number, name, list(rgb), free[0]])
+        self.counts = np.append(self.counts, 0)
+        self.bbox.append(None)
+        self.regions.append(0)
+        if grid_dtype(len(self.palette)) != self.grid.dtype:
+            self.grid = self.grid.astype(grid_dtype(len(self.palette)))
+            self._mark_rows(0, self.grid.shape[0])
+        return len(self.palette) - 1
+
+    def swap(self, op):
+        source, target = op['from'], op['to']
+        i = self._existing(source)
+        if target == source:
+            return
+        if self.index_of(target) is not None:
+            self.merge({'from': [source], 'into': target})
+            return
+        number, name, rgb = self._thread(target)
+        self.palette[i] = [number, name, list(rgb), self.palette[i][3]]
+
+    def merge(self, op):
+        sources = op['from'] if isinstance(op['from'], list) else [op['from']]
+        target = self.ensure_entry(op['into'])
+        lut = np.arange(len(self.palette), dtype=self.grid.dtype)
+        for dmc in sources:
+            i = self._existing(dmc)
+            if i != target:
+                lut[i] = target
+                self.counts[target] += self.counts[i]
+                self.counts[i] = 0
+                self.changed_colors.update((i, target))
+        self.grid = lut[self.grid]
+        self._mark_rows(0, self.grid.shape[0])
+
+    def repaint(self, op):
+        H, W = self.grid.shape
+        target = self.ensure_entry(op['dmc'])
+        where = self._existing(op['where']) if op.get('where') is not None else None
+        if 'rect' in op:
+            x0, y0, x1, y1 = (int(v) for v in op['rect'])
+            x0, x1 = max(x0, 0), min(x1, W)
+            y0, y1 = max(y0, 0), min(y1, H)
+            if x1 <= x0 or y1 <= y0:
+                return
+            region = self.grid[y0:y1, x0:x1]
+            selected = region == where if where is not None else np.ones(region.shape, dtype=bool)
+            old = region[selected]
+            region[selected] = target
+        elif 'cells' in op:
+            cells = np.asarray(op['cells'], dtype=np.int64).reshape(-1)
+            cells = np.unique(cells[(cells >= 0) & (cells < H * W)])
+            if not cells.size:
+                return
+            flat = self.grid.reshape(-1)
+            if where is not None:
+                cells = cells[flat[cells] == where]
+            old = flat[cells]
+            flat[cells] = target
+            y0, y1 = (int(cells.min()) // W, int(cells.max()) // W + 1) if cells.size else (0, 0)
+        else:
+            raise EditError("Repaint needs 'rect' or 'cells'")
+        self.counts -= np.bincount(old, minlength=len(self.counts))
+        self.counts[target] += old.size
+        if old.size:
+            self._mark_rows(y0, y1)
+            self.changed_colors.update(np.unique(old).tolist())
+            self.changed_colors.add(target)
+
+    def apply(self, ops):
+        if not isinstance(ops, list):
+            raise EditError("Edit operations must be a list")
+        for op in ops:
+            if not isinstance(op, dict):
+                raise EditError("Each edit operation must be an object")
+            action = op.get('op')
+            if action not in EDIT_OPS:
+                raise EditError(f"Unknown edit operation '{action}'")
+            try:
+                getattr(self, action)(op)
+            except KeyError as e:
+                raise EditError(f"Edit operation '{action}' is missing {e}")
+        self.drop_unused()
+        return self
+
+    def drop_unused(self):
+        """Remove threads no stitch uses any more, renumbering the grid"""
+        keep = self.counts > 0
+        if keep.all():
+            return
+        lut = (np.cumsum(keep) - 1).astype(grid_dtype(int(keep.sum())))
+        self.grid = lut[self.grid]
+        self.palette = [entry for entry, k in zip(self.palette, keep) if k]
+        self.counts = self.counts[keep]
+        self.bbox = [box for box, k in zip(self.bbox, keep) if k]
+        self.regions = [n for n, k in zip(self.regions, keep) if k]
+        self.changed_colors = {int(lut[i]) for i in self.changed_colors if keep[i]}
+        self._mark_rows(0, self.grid.shape[0])
+
+    def usage(self):
+        """Usage index of the edited pattern, rescanning only the threads an edit touched"""
+        bbox, regions = list(self.bbox), list(self.regions)
+        for i, (box, n) in color_usage(self.grid, self.changed_colors).items():
+            bbox[i], regions[i] = box, n
+        return {'counts': self.counts.tolist(), 'bbox': bbox, 'regions': regions}
+
+
+def colors_in_order(colors_used, palette):
+    """Previous colors_used order, dropping removed threads and appending new ones"""
+    present = [entry[0] for entry in palette]
+    kept = [dmc for dmc in colors_used if dmc in present]
+    return kept + [dmc for dmc in present if dmc not in kept]
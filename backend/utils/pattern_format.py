@@ -0,0 +1,121 @@
+# Compact Pattern Format
+# A pattern is stored as a palette table plus a dense index grid:
+#   {'format': 'indexed', 'version': 1, 'width': W, 'height': H,
+#    'palette': [[dmc, name, [r, g, b], symbol], ...],
+#    'dtype': 'uint8' | 'uint16',
+#    'grid': base64 of the row-major little-endian index grid}
+# Grid values index into the pattern's own palette table, not the DMC catalogue.
+# Saved patterns replace 'grid' with 'grid_ref', the key of a banded grid blob
+# in utils.blob_store. Conversions add 'usage', the per-entry counts, bounding
+# boxes and region counts of utils.usage.
+
+import base64
+import json
+import numpy as np
+
+PATTERN_FORMAT = 'indexed'
+PATTERN_FORMAT_VERSION = 1
+
+
+def grid_dtype(n_colors):
+    """Smallest unsigned dtype able to index n_colors palette entries"""
+    return np.dtype('<u1') if n_colors <= 256 else np.dtype('<u2')
+
+
+def encode_grid(grid, n_colors):
+    """Pack an index grid into a base64 string"""
+    dtype = grid_dtype(n_colors)
+    packed = np.ascontiguousarray(grid, dtype=dtype)
+    return dtype.name, base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def decode_grid(pattern):
+    """Unpack the index grid of a compact pattern into an HxW array"""
+    dtype = np.dtype(pattern['dtype']).newbyteorder('<')
+    raw = base64.b64decode(pattern['grid'])
+    grid = np.frombuffer(raw, dtype=dtype)
+    return grid.reshape(pattern['height'], pattern['width'])
+
+
+def encode_pattern(idx_map, palette_idx, symbol_map, used=None):
+    """Build a compact pattern from a palette index map
+
+    used, the sorted palette indices present in the map, is computed when
+    not given.
+    """
+    H, W = idx_map.shape
+    if used is None:
+        used, local = np.unique(idx_map, return_inverse=True)
+    else:
+        used = np.asarray(used)
+        lut = np.zeros(int(used.max(initial=0)) + 1, dtype=np.int64)
+        lut[used] = np.arange(len(used))
+        local = lut[idx_map]
+
+    palette = []
+    for idx in used.tolist():
+        dmc_num, dmc_name, rgb = palette_idx[idx]
+        palette.append([dmc_num, dmc_name, list(rgb), symbol_map[idx]])
+
+    dtype, grid = encode_grid(local.reshape(H, W), len(palette))
+    return {
+        'format': PATTERN_FORMAT,
+        'version': PATTERN_FORMAT_VERSION,
+        'width': W,
+        'height': H,
+        'palette': palette,
+        'dtype': dtype,
+        'grid': grid
+    }
+
+
+def compact_from_rows(rows):
+    """Convert a legacy list of per-cell dict rows into a compact pattern"""
+    H = len(rows)
+    W = len(rows[0]) if H else 0
+    palette = []
+    lookup = {}
+    grid = np.zeros((H, W), dtype=np.int32)
+
+    for y, row in enumerate(rows):
+        for x, cell in enumerate(row):
+            key = (cell['dmc'], cell['symbol'])
+            if key not in lookup:
+                lookup[key] = len(palette)
+                palette.append([cell['dmc'], cell['name'], list(cell['rgb']), cell['symbol']])
+            grid[y, x] = lookup[key]
+
+    dtype, packed = encode_grid(grid, len(palette))
+    return {
+        'format': PATTERN_FORMAT,
+        'version': PATTERN_FORMAT_VERSION,
+        'width': W,
+        'height': H,
+        'palette': palette,
+        'dtype': dtype,
+        'grid': packed
+    }
+
+
+def load_pattern_data(raw):
+    """Load stored pattern data, upgrading legacy per-cell rows to the compact format"""
+    data = json.loads(raw) if isinstance(raw, (str, bytes)) else raw
+    if isinstance(data, list):
+        data = {'pattern': data}
+    pattern = data.get('pattern')
+    if isinstance(pattern, list):
+        data = dict(data)
+        data['pattern'] = compact_from_rows(pattern)
+        data.setdefault('width', data['pattern']['width'])
+        data.setdefault('height', data['pattern']['height'])
+    return data
+
+
+def palette_lookup(pattern):
+    """Map local palette indices to (dmc, name, rgb) tuples for chart rendering"""
+    return {i: (dmc_num, dmc_name, tuple(rgb)) for i, (dmc_num, dmc_name, rgb, _) in enumerate(pattern['palette'])}
+
+
+def local_symbol_map(pattern):
+    """Map local palette indices to chart symbols"""
+    return {i: entry[3] for i, entry in enumerate(pattern['palette'])}
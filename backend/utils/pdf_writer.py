@@ -0,0 +1,147 @@
+# Incremental PDF Writer
+# Writes a PDF as a sequence of byte chunks: every page (with its images
+# and content stream) is emitted as soon as it is added, and only object
+# offsets are kept until the cross-reference table at the end. A document
+# of any length can therefore be streamed with the memory of one page.
+# Text uses the built-in Helvetica font, so nothing is embedded.
+
+import zlib
+import numpy as np
+
+PAGE_A4 = (595.0, 842.0)
+HELVETICA_DIGIT_EM = 0.556  # advance width of Helvetica digits in ems
+
+_CATALOG_ID = 1
+_PAGES_ID = 2
+_FONT_ID = 3
+
+
+def _num(value):
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+def _pdf_string(text):
+    escaped = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return '(' + escaped.encode('latin-1', 'replace').decode('latin-1') + ')'
+
+
+class PageContent:
+    """Drawing operators for one page, in PDF points from the bottom-left corner"""
+
+    def __init__(self):
+        self.ops = []
+        self.images = []
+
+    def fill_color(self, rgb):
+        self.ops.append(' '.join(_num(c / 255) for c in rgb) + ' rg')
+
+    def stroke_color(self, rgb):
+        self.ops.append(' '.join(_num(c / 255) for c in rgb) + ' RG')
+
+    def rect(self, x, y, w, h, fill=None, stroke=None, line_width=0.5):
+        """Rectangle filled and/or outlined with RGB colors"""
+        if fill is not None:
+            self.fill_color(fill)
+        if stroke is not None:
+            self.stroke_color(stroke)
+            self.ops.append(f"{_num(line_width)} w")
+        paint = 'B' if fill is not None and stroke is not None else ('f' if fill is not None else 'S')
+        self.ops.append(f"{_num(x)} {_num(y)} {_num(w)} {_num(h)} re {paint}")
+
+    def text(self, x, y, text, size=10, rgb=(0, 0, 0), align='left'):
+        """Helvetica text with its baseline at y; centre/right alignment assumes digit widths"""
+        if align != 'left':
+            width = len(text) * size * HELVETICA_DIGIT_EM
+            x -= width / 2 if align == 'center' else width
+        self.fill_color(rgb)
+        self.ops.append(f"BT /F1 {_num(size)} Tf {_num(x)} {_num(y)} Td {_pdf_string(text)} Tj ET")
+
+    def image(self, pixels, x, y, w, h):
+        """Place an (H, W) grayscale or (H, W, 3) RGB uint8 array in the box"""
+        name = f"Im{len(self.images)}"
+        self.images.append((name, pixels))
+        self.ops.append(f"q {_num(w)} 0 0 {_num(h)} {_num(x)} {_num(y)} cm /{name} Do Q")
+
+    def stream(self):
+        return '\n'.join(self.ops).encode('latin-1')
+
+
+class PdfWriter:
+    """Emits PDF bytes chunk by chunk; call begin(), page() for each page, then end()"""
+
+    def __init__(self, title=None, compress_level=6):
+        self.title = title
+        self.compress_level = compress_level
+        self.position = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = _FONT_ID + 1
+
+    def _object(self, obj_id, body):
+        data = f"{obj_id} 0 obj\n".encode('ascii') + body + b"\nendobj\n"
+        self.offsets[obj_id] = self.position
+        self.position += len(data)
+        return data
+
+    def _stream(self, obj_id, entries, payload):
+        compressed = zlib.compress(payload, self.compress_level)
+        head = f"<< {entries} /Filter /FlateDecode /Length {len(compressed)} >>\nstream\n".encode('ascii')
+        return self._object(obj_id, head + compressed + b"\nendstream")
+
+    def _reserve(self):
+        obj_id = self.next_id
+        self.next_id += 1
+        return obj_id
+
+    def begin(self):
+        """File header and the shared font"""
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.position = len(header)
+        font = self._object(_FONT_ID, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+                                      b"/Encoding /WinAnsiEncoding >>")
+        return header + font
+
+    def page(self, content, size=PAGE_A4):
+        """Bytes of one finished page: its images, content stream and page object"""
+        chunks = []
+        xobjects = []
+        for name, pixels in content.images:
+            pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+            space = '/DeviceRGB' if pixels.ndim == 3 else '/DeviceGray'
+            image_id = self._reserve()
+            chunks.append(self._stream(image_id, f"/Type /XObject /Subtype /Image /Width {pixels.shape[1]} "
+                                                 f"/Height {pixels.shape[0]} /ColorSpace {space} "
+                                                 f"/BitsPerComponent 8", pixels.tobytes()))
+            xobjects.append(f"/{name} {image_id} 0 R")
+
+        contents_id = self._reserve()
+        chunks.append(self._stream(contents_id, '', content.stream()))
+
+        page_id = self._reserve()
+        resources = f"/Font << /F1 {_FONT_ID} 0 R >>"
+        if xobjects:
+            resources += f" /XObject << {' '.join(xobjects)} >>"
+        chunks.append(self._object(page_id, (
+            f"<< /Type /Page /Parent {_PAGES_ID} 0 R /MediaBox [0 0 {_num(size[0])} {_num(size[1])}] "
+            f"/Resources << {resources} >> /Contents {contents_id} 0 R >>").encode('ascii')))
+        self.page_ids.append(page_id)
+        return b''.join(chunks)
+
+    def end(self):
+        """Page tree, catalog, cross-reference table and trailer"""
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        chunks = [self._object(_PAGES_ID, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>"
+                                          .encode('ascii')),
+                  self._object(_CATALOG_ID, f"<< /Type /Catalog /Pages {_PAGES_ID} 0 R >>".encode('ascii'))]
+        info = ''
+        if self.title:
+            info_id = self._reserve()
+            chunks.append(self._object(info_id, f"<< /Title {_pdf_string(self.title)} >>"
+                                       .encode('latin-1', 'replace')))
+            info = f" /Info {info_id} 0 R"
+
+        xref = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        xref += [f"{self.offsets[i]:010d} 00000 n \n" for i in range(1, self.next_id)]
+        xref.append(f"trailer\n<< /Size {self.next_id} /Root {_CATALOG_ID} 0 R{info} >>\n"
+                    f"startxref\n{self.position}\n%%EOF\n")
+        return b''.join(chunks) + ''.join(xref).encode('ascii')
@@ -0,0 +1,115 @@
+# Stitch Progress Bitsets
+# Progress is one bit per stitch in row-major order, packed, zlib-compressed
+# and base64-encoded, with a version number that increases on every change.
+# Clients send small operations (cell ranges, rows, every stitch of a color)
+# instead of rewriting the whole progress list.
+
+import base64
+import json
+import zlib
+import numpy as np
+
+PROGRESS_FORMAT = 'bitset'
+PROGRESS_OPS = ('set', 'clear', 'toggle')
+
+
+class ProgressConflict(Exception):
+    """Raised when progress changed since the client loaded it"""
+
+    def __init__(self, version):
+        super().__init__('Progress changed since it was loaded')
+        self.version = version
+
+
+def encode_progress(done, version):
+    """Serializable dict for a boolean per-stitch array"""
+    packed = np.packbits(done.reshape(-1).astype(bool))
+    return {
+        'format': PROGRESS_FORMAT,
+        'version': int(version),
+        'cells': int(done.size),
+        'bits': base64.b64encode(zlib.compress(packed.tobytes(), 9)).decode('ascii')
+    }
+
+
+def _from_legacy(items, width, height):
+    """Boolean array from an old progress list of flat indices or [x, y] pairs"""
+    done = np.zeros(width * height, dtype=bool)
+    for item in items:
+        if isinstance(item, int):
+            i = item
+        elif isinstance(item, (list, tuple)) and len(item) == 2:
+            i = int(item[1]) * width + int(item[0])
+        elif isinstance(item, dict) and 'x' in item and 'y' in item:
+            i = int(item['y']) * width + int(item['x'])
+        else:
+            continue
+        if 0 <= i < done.size:
+            done[i] = True
+    return done
+
+
+def decode_progress(raw, width, height):
+    """(done, version) from stored progress data; unknown or missing data is empty"""
+    n_cells = width * height
+    data = json.loads(raw) if isinstance(raw, str) else raw
+    if isinstance(data, dict) and data.get('format') == PROGRESS_FORMAT:
+        packed = np.frombuffer(zlib.decompress(base64.b64decode(data['bits'])), dtype=np.uint8)
+        done = np.unpackbits(packed, count=data['cells']).astype(bool)
+        if done.size != n_cells:
+            # Stitches beyond the stored ones start undone
+            resized = np.zeros(n_cells, dtype=bool)
+            resized[:min(done.size, n_cells)] = done[:n_cells]
+            done = resized
+        return done, int(data.get('version', 0))
+    if isinstance(data, list):
+        return _from_legacy(data, width, height), 0
+    return np.zeros(n_cells, dtype=bool), 0
+
+
+def _op_mask(op, idx_map):
+    """Boolean per-stitch mask selected by one patch operation"""
+    H, W = idx_map.shape
+    mask = np.zeros(H * W, dtype=bool)
+    if 'range' in op:
+        start, stop = (int(v) for v in op['range'])
+        mask[max(start, 0):max(stop, 0)] = True
+    elif 'rows' in op:
+        y0, y1 = (int(v) for v in op['rows'])
+        mask[max(y0, 0) * W:max(y1, 0) * W] = True
+    elif 'color' in op:
+        mask = idx_map.reshape(-1) == int(op['color'])
+    elif 'cells' in op:
+        cells = np.asarray(op['cells'], dtype=np.int64).reshape(-1)
+        mask[cells[(cells >= 0) & (cells < mask.size)]] = True
+    else:
+        raise ValueError("Operation needs one of 'range', 'rows', 'color' or 'cells'")
+    return mask
+
+
+def apply_ops(done, ops, idx_map):
+    """Apply patch operations to a boolean per-stitch array in place"""
+    if not isinstance(ops, list):
+        raise ValueError("Progress operations must be a list")
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError("Each progress operation must be an object")
+        action = op.get('op', 'set')
+        if action not in PROGRESS_OPS:
+            raise ValueError(f"Unknown progress operation '{action}'")
+        mask = _op_mask(op, idx_map)
+        if action == 'set':
+            done |= mask
+        elif action == 'clear':
+            done &= ~mask
+        else:
+            done ^= mask
+    return done
+
+
+def color_counts(done, idx_map, n_colors):
+    """Completed and total stitches per local palette index"""
+    flat = idx_map.reshape(-1)
+    completed = np.bincount(flat[done], minlength=n_colors)
+    total = np.bincount(flat, minlength=n_colors)
+    return completed, total
@@ -0,0 +1,91 @@
+# Conversion Result Cache
+# Content-addressed store for conversion outputs (finished patterns and
+# resized stitch grids). Entries live as files in one folder with a small
+# SQLite index beside them, so every worker process shares the same cache.
+# The total size is kept under a byte budget by evicting least recently used
+# entries.
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+
+def cache_key(*parts):
+    """Stable key for a tuple of JSON-serializable parts"""
+    return hashlib.sha256(json.dumps(parts, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Bounded LRU cache of byte blobs shared through the filesystem"""
+
+    def __init__(self, folder, max_bytes=256 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    def _connect(self):
+        # A fresh connection per call keeps the cache safe to use after fork
+        os.makedirs(self.folder, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.folder, 'index.db'), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                     "key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        return conn
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+    def get(self, key):
+        """Cached bytes for key or None"""
+        if not self.folder:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return data
+
+    def put(self, key, data):
+        """Store bytes under key and evict old entries beyond the budget"""
+        if not self.folder:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                         (key, len(data), time.time()))
+            used = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if used > self.max_bytes:
+                self._evict(conn, used)
+
+    def _evict(self, conn, used):
+        """Drop least recently used entries until under 90% of the budget"""
+        target = self.max_bytes * 0.9
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if used <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            used -= size
@@ -0,0 +1,55 @@
+# SQLite Connection Settings
+# Every SQLite connection is opened in WAL mode. Readers then never block
+# the writer, and the writer never blocks readers. A busy timeout makes
+# concurrent writers wait for the write lock instead of failing with
+# "database is locked". synchronous=NORMAL skips an fsync per commit; in WAL
+# mode this cannot corrupt the database and only risks the last commits on
+# power loss. Pool sizes are per worker process: one connection per request
+# thread plus some overflow.
+
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 30000,  # milliseconds
+    'temp_store': 'MEMORY',
+}
+
+_PRAGMAS = {}
+
+
+def is_file_database(uri):
+    """Whether a database URI names an SQLite file (pool settings do not apply to :memory:)"""
+    return uri.startswith('sqlite:///') and ':memory:' not in uri
+
+
+def engine_options(busy_timeout=30.0, pool_size=8, max_overflow=8, pool_timeout=30):
+    """SQLALCHEMY_ENGINE_OPTIONS for an SQLite file shared by the threads of one worker"""
+    return {
+        'connect_args': {'timeout': busy_timeout, 'check_same_thread': False},
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_timeout': pool_timeout,
+    }
+
+
+def install_pragmas(pragmas=None):
+    """Run PRAGMAs on every new SQLite connection of any engine"""
+    _PRAGMAS.clear()
+    _PRAGMAS.update(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+    if not event.contains(Engine, 'connect', _set_pragmas):
+        event.listen(Engine, 'connect', _set_pragmas)
+
+
+def _set_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
@@ -0,0 +1,143 @@
+# Chart Tile Cache
+# Rendered chart tiles are kept in a bounded in-memory LRU backed by a bounded
+# on-disk directory. Tiles are keyed by pattern version, so a changed pattern
+# never serves stale tiles; older versions are dropped when a new one appears.
+# The last seen version is remembered for a bounded number of recently used
+# patterns; a forgotten pattern only costs one more purge when it comes back.
+
+import os
+import threading
+from collections import OrderedDict
+
+
+class TileCache:
+    """Two-level (memory, disk) LRU cache for encoded chart tiles"""
+
+    def __init__(self, folder=None, memory_bytes=64 * 1024 * 1024, disk_bytes=512 * 1024 * 1024,
+                 max_patterns=4096):
+        self.folder = folder
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_patterns = max_patterns
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._versions = OrderedDict()
+        self._disk_used = None
+        self._lock = threading.Lock()
+
+    def _path(self, pattern_id, version, name):
+        return os.path.join(self.folder, str(pattern_id), f"{version}_{name}.png")
+
+    def _disk_files(self):
+        for root, _, files in os.walk(self.folder):
+            for filename in files:
+                path = os.path.join(root, filename)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _note_version(self, pattern_id, version):
+        """Drop tiles of older versions once a pattern's version changes"""
+        if self._versions.get(pattern_id) != version:
+            self._versions[pattern_id] = version
+            self._purge(pattern_id, keep_version=version)
+        self._versions.move_to_end(pattern_id)
+        while len(self._versions) > self.max_patterns:
+            self._versions.popitem(last=False)
+
+    def _purge(self, pattern_id, keep_version=None):
+        for key in [k for k in self._memory if k[0] == pattern_id and k[1] != keep_version]:
+            self._memory_used -= len(self._memory.pop(key))
+        if not self.folder:
+            return
+        pattern_dir = os.path.join(self.folder, str(pattern_id))
+        if not os.path.isdir(pattern_dir):
+            return
+        for filename in os.listdir(pattern_dir):
+            if keep_version is None or not filename.startswith(f"{keep_version}_"):
+                path = os.path.join(pattern_dir, filename)
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                    if self._disk_used is not None:
+                        self._disk_used -= size
+                except OSError:
+                    pass
+
+    def get(self, pattern_id, version, name):
+        """Cached tile bytes or None"""
+        key = (pattern_id, version, name)
+        with self._lock:
+            self._note_version(pattern_id, version)
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        if not self.folder:
+            return None
+        path = self._path(pattern_id, version, name)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self._remember(key, data)
+        return data
+
+    def put(self, pattern_id, version, name, data):
+        """Store tile bytes in memory and on disk"""
+        key = (pattern_id, version, name)
+        with self._lock:
+            self._note_version(pattern_id, version)
+            self._remember(key, data)
+
+        if not self.folder:
+            return
+        path = self._path(pattern_id, version, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._disk_used is None:
+                self._disk_used = sum(size for _, size, _ in self._disk_files())
+            else:
+                self._disk_used += len(data)
+            if self._disk_used > self.disk_bytes:
+                self._evict_disk()
+
+    def invalidate(self, pattern_id):
+        """Forget every cached tile of a pattern"""
+        with self._lock:
+            self._versions.pop(pattern_id, None)
+            self._purge(pattern_id)
+
+    def _remember(self, key, data):
+        if key in self._memory:
+            self._memory_used -= len(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, old = self._memory.popitem(last=False)
+            self._memory_used -= len(old)
+
+    def _evict_disk(self):
+        """Remove least recently used tile files until under budget"""
+        files = sorted(self._disk_files(), key=lambda f: f[2])
+        used = sum(size for _, size, _ in files)
+        target = self.disk_bytes * 0.9
+        for path, size, _ in files:
+            if used <= target:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass
+        self._disk_used = used
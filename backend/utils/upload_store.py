@@ -0,0 +1,162 @@
+# Upload Store
+# Uploaded images are kept under their content hash in sharded folders
+# (folder/ab/abcdef....jpg) with a small SQLite index of owner, size and
+# last use beside them. Files that no saved pattern references are removed
+# once unused for longer than a TTL, and the least recently used of them
+# are evicted whenever the total size exceeds a byte budget. Files used in
+# the last few minutes are never evicted, so queued conversions still find
+# their input.
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+SQLITE_MAX_PARAMS = 500
+
+
+class UploadStore:
+    """Bounded store of uploaded originals shared through the filesystem"""
+
+    def __init__(self, folder, max_bytes=2 * 1024 * 1024 * 1024, ttl=24 * 3600, min_age=15 * 60,
+                 referenced=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.min_age = min_age
+        self.referenced = referenced or (lambda names: set())
+        self._sweeper = None
+
+    def _connect(self):
+        # A fresh connection per call keeps the store safe to use after fork
+        os.makedirs(self.folder, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.folder, 'index.db'), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS uploads ("
+                     "name TEXT PRIMARY KEY, owner TEXT, size INTEGER NOT NULL, "
+                     "created_at REAL NOT NULL, last_used REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_uploads_last_used ON uploads (last_used)")
+        return conn
+
+    def path(self, name):
+        """Path of a stored upload; files from before sharding stay in the top folder"""
+        sharded = os.path.join(self.folder, name[:2], name)
+        if not os.path.exists(sharded):
+            flat = os.path.join(self.folder, name)
+            if os.path.exists(flat):
+                return flat
+        return sharded
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def put(self, name, data, owner=None):
+        """Store bytes under name (unless already present) and enforce the byte budget"""
+        path = self.path(name)
+        now = time.time()
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT INTO uploads (name, owner, size, created_at, last_used) VALUES (?, ?, ?, ?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET last_used = excluded.last_used",
+                         (name, owner, size, now, now))
+            used = conn.execute("SELECT COALESCE(SUM(size), 0) FROM uploads").fetchone()[0]
+        if used > self.max_bytes:
+            self.evict(keep=name)
+        return path
+
+    def rewrite(self, name, data):
+        """Replace the bytes of a stored upload, keeping its name and last use"""
+        path = self.path(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE uploads SET size = ? WHERE name = ?", (len(data), name))
+
+    def touch(self, name):
+        """Mark an upload as used now"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE uploads SET last_used = ? WHERE name = ?", (time.time(), name))
+
+    def _unreferenced(self, rows):
+        """Rows whose file no saved pattern uses"""
+        names = [row[0] for row in rows]
+        used = set()
+        for i in range(0, len(names), SQLITE_MAX_PARAMS):
+            used |= self.referenced(names[i:i + SQLITE_MAX_PARAMS])
+        return [row for row in rows if row[0] not in used]
+
+    def _remove(self, conn, names):
+        for name in names:
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+        conn.executemany("DELETE FROM uploads WHERE name = ?", [(name,) for name in names])
+
+    def evict(self, keep=None):
+        """Drop least recently used unreferenced uploads (other than keep) until under 90% of the budget"""
+        cutoff = time.time() - self.min_age
+        with closing(self._connect()) as conn, conn:
+            used = conn.execute("SELECT COALESCE(SUM(size), 0) FROM uploads").fetchone()[0]
+            target = self.max_bytes * 0.9
+            if used <= target:
+                return 0
+            rows = conn.execute("SELECT name, size FROM uploads WHERE last_used < ? AND name IS NOT ? "
+                                "ORDER BY last_used", (cutoff, keep)).fetchall()
+            victims = []
+            for name, size in self._unreferenced(rows):
+                if used <= target:
+                    break
+                victims.append(name)
+                used -= size
+            self._remove(conn, victims)
+        return len(victims)
+
+    def sweep(self):
+        """Remove unreferenced uploads unused for longer than the TTL, then enforce the budget"""
+        with closing(self._connect()) as conn, conn:
+            rows = conn.execute("SELECT name, size FROM uploads WHERE last_used < ?",
+                                (time.time() - max(self.ttl, self.min_age),)).fetchall()
+            expired = [name for name, _ in self._unreferenced(rows)]
+            self._remove(conn, expired)
+        return len(expired) + self.evict()
+
+    def adopt_files(self):
+        """Index files written before the store kept an index, dated by their modification time"""
+        adopted = 0
+        with closing(self._connect()) as conn, conn:
+            known = {row[0] for row in conn.execute("SELECT name FROM uploads")}
+            for entry in os.scandir(self.folder):
+                if entry.is_file() and entry.name not in known and not entry.name.startswith('index.db') \
+                        and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    conn.execute("INSERT INTO uploads (name, owner, size, created_at, last_used) "
+                                 "VALUES (?, NULL, ?, ?, ?)", (entry.name, stat.st_size, stat.st_mtime, stat.st_mtime))
+                    adopted += 1
+        return adopted
+
+    def start_sweeper(self, interval, on_error=None):
+        """Run sweep() every interval seconds in a daemon thread"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.sweep()
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(e)
+
+        self._sweeper = threading.Thread(target=run, name='upload-sweeper', daemon=True)
+        self._sweeper.start()
@@ -0,0 +1,168 @@
+# Thread Usage Index
+# Per-color statistics of a pattern, computed once from its index grid and
+# stored with the pattern so legends, shopping lists and estimates never
+# rescan the grid:
+#   {'counts':  [stitches per local palette entry],
+#    'bbox':    [[x0, y0, x1, y1] (exclusive) or None per entry],
+#    'regions': [4-connected areas of each color]}
+# Thread estimates turn stitch counts into length and skeins for a canvas
+# mesh count and stitch type. After an edit, color_usage rescans only the
+# stitches of the colors the edit touched.
+
+import math
+import numpy as np
+
+# Thread used per stitch, in multiples of the canvas pitch, front and back
+STITCH_TYPES = {
+    'continental': 2 * math.sqrt(2),  # diagonal front, diagonal back
+    'basketweave': 2 * math.sqrt(2),
+    'half-cross': math.sqrt(2) + 1,  # diagonal front, straight back
+    'cross': 2 * math.sqrt(2) + 2,  # two diagonals, two straight backs
+}
+DEFAULT_STITCH = 'continental'
+THREAD_WASTE = 1.2  # thread left in the needle and lost to twisting
+TAIL_METRES = 0.08  # starting and ending tails, once per separate region
+SKEIN_METRES = 8.0  # one DMC stranded cotton skein
+SKEIN_STRANDS = 6
+# Strands of stranded cotton that cover the canvas, by mesh count
+STRANDS_BY_MESH = ((10, 12), (12, 10), (13, 9), (14, 8), (16, 7), (18, 6), (22, 4), (24, 3))
+
+
+def _runs(grid):
+    """Horizontal runs of equal values: (values, rows, x0, x1) in row-major order, plus each cell's run"""
+    H, W = grid.shape
+    starts = np.ones((H, W), dtype=bool)
+    starts[:, 1:] = grid[:, 1:] != grid[:, :-1]
+    run_of = np.cumsum(starts.reshape(-1)) - 1
+    first = np.flatnonzero(starts.reshape(-1))
+    last = np.append(first[1:], H * W) - 1
+    # A run never crosses a row because every row starts a new one
+    return grid.reshape(-1)[first], first // W, first % W, last % W + 1, run_of.reshape(H, W)
+
+
+def _components(n_nodes, a, b):
+    """Root of every node of an undirected graph given by edges (a, b)"""
+    parent = np.arange(n_nodes)
+    while True:
+        pa, pb = parent[a], parent[b]
+        linked = pa != pb
+        if not linked.any():
+            return parent
+        # Hook the larger root onto the smaller, then flatten every tree
+        np.minimum.at(parent, np.maximum(pa, pb)[linked], np.minimum(pa, pb)[linked])
+        while True:
+            flat = parent[parent]
+            if (flat == parent).all():
+                break
+            parent = flat
+
+
+def usage_index(grid, n_colors):
+    """Counts, bounding boxes and region counts of every palette entry of an index grid"""
+    grid = np.asarray(grid)
+    values, rows, x0, x1, run_of = _runs(grid)
+    lengths = x1 - x0
+    counts = np.bincount(values, weights=lengths, minlength=n_colors).astype(np.int64)
+
+    big = np.iinfo(np.int64).max
+    bbox = np.stack([np.full(n_colors, big), np.full(n_colors, big),
+                     np.full(n_colors, -1), np.full(n_colors, -1)], axis=1)
+    np.minimum.at(bbox[:, 0], values, x0)
+    np.minimum.at(bbox[:, 1], values, rows)
+    np.maximum.at(bbox[:, 2], values, x1)
+    np.maximum.at(bbox[:, 3], values, rows + 1)
+
+    # Runs are joined by vertically adjacent stitches of the same color
+    same = grid[1:] == grid[:-1]
+    a, b = run_of[:-1][same], run_of[1:][same]
+    pairs = np.unique(a * len(values) + b)
+    root = _components(len(values), pairs // len(values), pairs % len(values))
+    roots = root == np.arange(len(values))
+    regions = np.bincount(values[roots], minlength=n_colors)
+
+    return {
+        'counts': counts.tolist(),
+        'bbox': [box.tolist() if count else None for box, count in zip(bbox, counts)],
+        'regions': regions.tolist(),
+    }
+
+
+def color_usage(grid, colors):
+    """{color: (bbox or None, regions)} for some palette entries, touching only their stitches"""
+    grid = np.asarray(grid)
+    H, W = grid.shape
+    colors = sorted(colors)
+    if not colors:
+        return {}
+    flat = grid.reshape(-1)
+    cells = np.flatnonzero(np.isin(flat, colors))
+    if not cells.size:
+        return dict.fromkeys(colors, (None, 0))
+    values = flat[cells]
+    x = cells % W
+
+    # Horizontal runs among the selected stitches
+    starts = np.ones(len(cells), dtype=bool)
+    starts[1:] = (np.diff(cells) != 1) | (values[1:] != values[:-1]) | (x[1:] == 0)
+    run_of = np.cumsum(starts) - 1
+    first = np.flatnonzero(starts)
+    last = np.append(first[1:], len(cells)) - 1
+    run_values, rows, x0, x1 = values[first], cells[first] // W, x[first], x[last] + 1
+
+    # Runs joined by a same-colored stitch below; cells are in row-major
+    # order, so repeats of one pair of runs are adjacent
+    run_at = np.empty(H * W, dtype=np.int64)
+    run_at[cells] = run_of
+    below = cells + W
+    linked = np.flatnonzero(below < H * W)
+    linked = linked[flat[below[linked]] == values[linked]]
+    a, b = run_of[linked], run_at[below[linked]]
+    keep = np.ones(len(a), dtype=bool)
+    keep[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    root = _components(len(first), a[keep], b[keep])
+    roots = root == np.arange(len(first))
+
+    result = {}
+    for color in colors:
+        mine = run_values == color
+        if not mine.any():
+            result[color] = (None, 0)
+            continue
+        bbox = [int(x0[mine].min()), int(rows[mine].min()), int(x1[mine].max()), int(rows[mine].max()) + 1]
+        result[color] = (bbox, int((mine & roots).sum()))
+    return result
+
+
+def valid_usage(usage, n_colors, n_cells):
+    """Whether a stored usage index fits a pattern of n_colors entries and n_cells stitches"""
+    if not isinstance(usage, dict):
+        return False
+    counts = usage.get('counts')
+    return (isinstance(counts, list) and len(counts) == n_colors and sum(counts) == n_cells
+            and all(len(usage.get(key) or ()) == n_colors for key in ('bbox', 'regions')))
+
+
+def strands_for_mesh(mesh_count):
+    """Strands of stranded cotton for a canvas mesh count"""
+    for mesh, strands in STRANDS_BY_MESH:
+        if mesh_count <= mesh:
+            return strands
+    return STRANDS_BY_MESH[-1][1]
+
+
+def thread_estimate(count, mesh_count, stitch=DEFAULT_STITCH, strands=None, regions=1):
+    """(metres, skeins) of thread for count stitches in a number of separate regions
+
+    Metres are the length of the threaded needle; skeins are fractional so
+    estimates can be added up before rounding.
+    """
+    if stitch not in STITCH_TYPES:
+        raise ValueError(f"Unknown stitch type '{stitch}'")
+    if mesh_count <= 0:
+        raise ValueError("Mesh count must be positive")
+    if not count:
+        return 0.0, 0.0
+    strands = strands or strands_for_mesh(mesh_count)
+    pitch = 0.0254 / mesh_count  # metres between canvas holes
+    metres = count * STITCH_TYPES[stitch] * pitch * THREAD_WASTE + regions * TAIL_METRES
+    return metres, metres * strands / (SKEIN_STRANDS * SKEIN_METRES)
@@ -0,0 +1,73 @@
+# Write-Behind Queue
+# Rapid updates to the same record, such as a stitcher ticking off cells,
+# are coalesced in memory per key. A background thread writes them in
+# batches, so the database sees one short transaction per flush instead of
+# one per request. Readers see pending values through get(). Nothing is
+# pending for longer than the delay plus one write. flush() writes
+# immediately, and close(), also run at exit, writes whatever is left.
+
+import atexit
+import threading
+
+
+class WriteBehind:
+    """Pending values per key, handed to write(batch) in the background"""
+
+    def __init__(self, write, delay=0.5, max_pending=64, on_error=None):
+        self.write = write  # write({key: value}); raising keeps the batch pending
+        self.delay = delay
+        self.max_pending = max_pending
+        self.on_error = on_error
+        self._pending = {}
+        self._lock = threading.Lock()  # held while a batch is written, so updates never race a flush
+        self._stop = threading.Event()
+        self._thread = None
+
+    def get(self, key):
+        """Pending value for key, or None when everything is written"""
+        with self._lock:
+            return self._pending.get(key)
+
+    def update(self, key, fn):
+        """Set the pending value of key to fn(pending value or None) and schedule it; returns the value"""
+        with self._lock:
+            value = fn(self._pending.get(key))
+            self._pending[key] = value
+            full = len(self._pending) >= self.max_pending
+        if self.delay <= 0 or full:
+            self.flush()
+        else:
+            self._start()
+        return value
+
+    def flush(self):
+        """Write all pending values now; returns how many were written"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch = dict(self._pending)
+            self.write(batch)
+            self._pending.clear()
+            return len(batch)
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        while not self._stop.wait(self.delay):
+            try:
+                self.flush()
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(e)
+
+    def close(self):
+        """Stop the background thread and write what is left"""
+        self._stop.set()
+        self.flush()
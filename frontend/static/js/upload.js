@@ -18,6 +18,9 @@ document.addEventListener('DOMContentLoaded', function() {
     const customStitchWidth = document.getElementById('customStitchWidth');
     const customStitchHeight = document.getElementById('customStitchHeight');
     const maxColors = document.getElementById('maxColors');
+    const colorMetric = document.getElementById('colorMetric');
+    const reduceMode = document.getElementById('reduceMode');
+    const ditherMode = document.getElementById('ditherMode');
     const patternPreview = document.getElementById('patternPreview');
     const patternCanvas = document.getElementById('patternCanvas');
     const previewCanvasSize = document.getElementById('previewCanvasSize');
@@ -157,23 +160,30 @@ document.addEventListener('DOMContentLoaded', function() {
         // Get max colors
         formData.append('max_colors', maxColors.value);
 
+        // Get color matching metric
+        formData.append('metric', colorMetric.value);
+        formData.append('reduce_mode', reduceMode.value);
+        formData.append('dither', ditherMode.value);
+
         // Show loading state
         const submitBtn = document.getElementById('createPatternBtn');
         const originalText = submitBtn.innerHTML;
         submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Creating Pattern...';
         submitBtn.disabled = true;
 
-        // Send request
-        fetch('/upload', {
-            method: 'POST',
-            body: formData
-        })
-        .then(response => response.json())
+        // Stream a coarse preview and then the full pattern where the browser
+        // can read response bodies; otherwise queue a job and poll it
+        const conversion = window.ReadableStream && window.TextDecoder
+            ? convertProgressive(formData)
+            : convertWithJob(formData);
+        conversion
         .then(data => {
             if (data.success) {
                 currentPatternData = data.pattern_data;
                 currentOriginalImage = data.original_image;
-                showPatternPreview(data);
+                if (!data.streamed) {
+                    showPatternPreview(data);
+                }
             } else {
                 showNotification(data.error || 'Failed to create pattern', 'error');
             }
@@ -188,63 +198,210 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    function convertWithJob(formData) {
+        formData.append('async', '1');
+        return fetch('/upload', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => response.json())
+        .then(data => data.job_id ? waitForJob(data.job_id) : data);
+    }
+
+    // Read Server-Sent Events from /upload/stream, drawing the preview and
+    // then each band of the full pattern as it arrives
+    function convertProgressive(formData) {
+        return fetch('/upload/stream', {
+            method: 'POST',
+            body: formData
+        })
+        .then(response => {
+            const type = response.headers.get('Content-Type') || '';
+            if (!type.startsWith('text/event-stream') || !response.body) {
+                return response.json();
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let result = { success: false, error: 'Pattern stream ended early' };
+            let meta = null;
+            let grid = null;
+
+            const handle = (event, data) => {
+                if (event === 'preview') {
+                    drawPatternPreview(data.pattern);
+                    patternPreview.style.display = 'block';
+                } else if (event === 'palette') {
+                    meta = data;
+                    const pattern = meta.pattern;
+                    grid = pattern.dtype === 'uint16'
+                        ? new Uint16Array(pattern.width * pattern.height)
+                        : new Uint8Array(pattern.width * pattern.height);
+                    startPatternCanvas(pattern);
+                } else if (event === 'band') {
+                    const rows = decodePatternGrid({ grid: data.grid, dtype: meta.pattern.dtype });
+                    grid.set(rows, data.y * meta.pattern.width);
+                    drawPatternRows(meta.pattern, grid, data.y, data.y + data.rows);
+                } else if (event === 'done') {
+                    meta.pattern.grid = encodePatternGrid(grid);
+                    result = { ...data, pattern_data: meta, streamed: true };
+                    showPatternDetails(result);
+                } else if (event === 'error') {
+                    result = { success: false, error: data.error };
+                }
+            };
+
+            const read = () => reader.read().then(({ done, value }) => {
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                let end;
+                while ((end = buffer.indexOf('\n\n')) >= 0) {
+                    const message = buffer.slice(0, end);
+                    buffer = buffer.slice(end + 2);
+                    let event = 'message';
+                    let payload = '';
+                    message.split('\n').forEach(line => {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) payload += line.slice(6);
+                    });
+                    handle(event, JSON.parse(payload));
+                }
+                return done ? result : read();
+            });
+            return read();
+        });
+    }
+
+    // Poll a conversion job and resolve with its result payload
+    function waitForJob(jobId, delay = 250) {
+        return new Promise(resolve => setTimeout(resolve, delay))
+            .then(() => fetch(`/jobs/${jobId}/result`))
+            .then(response => {
+                if (response.status === 202) {
+                    return waitForJob(jobId, Math.min(delay * 2, 2000));
+                }
+                return response.json();
+            });
+    }
+
     function showPatternPreview(data) {
+        // Draw pattern preview
+        drawPatternPreview(data.pattern_data.pattern);
+        showPatternDetails(data);
+    }
+
+    function showPatternDetails(data) {
         const pattern = data.pattern_data.pattern;
-        const colors = data.pattern_data.colors_used;
         
         // Update preview information
         previewCanvasSize.textContent = data.canvas_size;
         previewMeshCount.textContent = data.mesh_count + ' mesh';
-        previewColorsUsed.textContent = colors.length;
-        previewTotalStitches.textContent = pattern.length * pattern[0].length;
-
-        // Draw pattern preview
-        drawPatternPreview(pattern);
+        previewColorsUsed.textContent = pattern.palette.length;
+        previewTotalStitches.textContent = pattern.width * pattern.height;
 
         // Show color swatches
-        showColorSwatches(colors);
+        showColorSwatches(pattern.palette, pattern.usage);
 
         // Show preview
         patternPreview.style.display = 'block';
         patternPreview.scrollIntoView({ behavior: 'smooth' });
     }
 
+    // Decode the base64 index grid of a compact pattern
+    function decodePatternGrid(pattern) {
+        const raw = atob(pattern.grid);
+        const bytes = new Uint8Array(raw.length);
+        for (let i = 0; i < raw.length; i++) {
+            bytes[i] = raw.charCodeAt(i);
+        }
+        if (pattern.dtype === 'uint16') {
+            const grid = new Uint16Array(bytes.length / 2);
+            const view = new DataView(bytes.buffer);
+            for (let i = 0; i < grid.length; i++) {
+                grid[i] = view.getUint16(i * 2, true);
+            }
+            return grid;
+        }
+        return bytes;
+    }
+
+    // Base64 of an index grid, the inverse of decodePatternGrid
+    function encodePatternGrid(grid) {
+        const bytes = grid instanceof Uint16Array ? new Uint8Array(grid.length * 2) : grid;
+        if (grid instanceof Uint16Array) {
+            const view = new DataView(bytes.buffer);
+            for (let i = 0; i < grid.length; i++) {
+                view.setUint16(i * 2, grid[i], true);
+            }
+        }
+        let raw = '';
+        for (let i = 0; i < bytes.length; i += 0x8000) {
+            raw += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+        }
+        return btoa(raw);
+    }
+
+    // Size the canvas for a pattern without clearing what is drawn on it,
+    // so a coarse preview stays visible until the bands cover it
+    function startPatternCanvas(pattern) {
+        const canvas = patternCanvas;
+        const cellSize = 400 / Math.max(pattern.height, pattern.width);
+        const width = Math.floor(pattern.width * cellSize);
+        const height = Math.floor(pattern.height * cellSize);
+        if (canvas.width !== width || canvas.height !== height) {
+            const previous = document.createElement('canvas');
+            previous.width = canvas.width;
+            previous.height = canvas.height;
+            previous.getContext('2d').drawImage(canvas, 0, 0);
+            canvas.width = width;
+            canvas.height = height;
+            canvas.getContext('2d').drawImage(previous, 0, 0, width, height);
+        }
+    }
+
     function drawPatternPreview(pattern) {
         const canvas = patternCanvas;
-        const ctx = canvas.getContext('2d');
-        const cellSize = 400 / Math.max(pattern.length, pattern[0].length);
+        const cellSize = 400 / Math.max(pattern.height, pattern.width);
         
-        canvas.width = pattern[0].length * cellSize;
-        canvas.height = pattern.length * cellSize;
+        canvas.width = pattern.width * cellSize;
+        canvas.height = pattern.height * cellSize;
 
         // Clear canvas
-        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        canvas.getContext('2d').clearRect(0, 0, canvas.width, canvas.height);
+
+        drawPatternRows(pattern, decodePatternGrid(pattern), 0, pattern.height);
+    }
+
+    function drawPatternRows(pattern, grid, y0, y1) {
+        const ctx = patternCanvas.getContext('2d');
+        const cellSize = 400 / Math.max(pattern.height, pattern.width);
+        const fills = pattern.palette.map(entry => `rgb(${entry[2][0]}, ${entry[2][1]}, ${entry[2][2]})`);
 
         // Draw pattern
-        for (let y = 0; y < pattern.length; y++) {
-            for (let x = 0; x < pattern[y].length; x++) {
-                const cell = pattern[y][x];
-                const rgb = cell.rgb;
-                
-                ctx.fillStyle = `rgb(${rgb[0]}, ${rgb[1]}, ${rgb[2]})`;
+        ctx.strokeStyle = '#ddd';
+        ctx.lineWidth = 0.5;
+        for (let y = y0; y < y1; y++) {
+            for (let x = 0; x < pattern.width; x++) {
+                ctx.fillStyle = fills[grid[y * pattern.width + x]];
                 ctx.fillRect(x * cellSize, y * cellSize, cellSize, cellSize);
                 
                 // Draw grid lines
-                ctx.strokeStyle = '#ddd';
-                ctx.lineWidth = 0.5;
                 ctx.strokeRect(x * cellSize, y * cellSize, cellSize, cellSize);
             }
         }
     }
 
-    function showColorSwatches(colors) {
+    function showColorSwatches(palette, usage) {
         colorSwatches.innerHTML = '';
         
-        colors.forEach(color => {
+        palette.forEach(([dmc, name, rgb], i) => {
             const swatch = document.createElement('div');
             swatch.className = 'color-swatch';
-            swatch.style.backgroundColor = `rgb(${color.rgb[0]}, ${color.rgb[1]}, ${color.rgb[2]})`;
-            swatch.title = `DMC ${color.dmc} - ${color.name}`;
+            swatch.style.backgroundColor = `rgb(${rgb[0]}, ${rgb[1]}, ${rgb[2]})`;
+            swatch.title = `DMC ${dmc} - ${name}`;
+            if (usage) {
+                swatch.title += ` (${usage.counts[i]} stitches)`;
+            }
             colorSwatches.appendChild(swatch);
         });
     }